@@ -0,0 +1,187 @@
+import time
+
+import metrics
+from subscriptions import RULE_TOPIC
+from templates import MessageRenderer
+
+ALERTS = metrics.counter("alerts_total", "Сработавшие алерты детектора")
+ALERTS_SUPPRESSED = metrics.counter("alerts_suppressed_total", "Алерты, отброшенные кулдауном или дублем")
+DIGESTS = metrics.counter("alert_digests_total", "Отправленные дайджесты")
+
+
+class AlertBatcher:
+    """Склейка алертов между детектором и рассылкой.
+
+    Алерты одного цикла (или окна `window` секунд) собираются вместе. При
+    отправке каждому чату достаются только подходящие ему алерты, по каждому
+    символу — самый сильный; повторы внутри `cooldown` отбрасываются для каждого
+    чата отдельно — алерт по низкому порогу одного чата не глушит другим более
+    сильные. Один алерт уходит как есть, несколько — одним дайджестом. Чаты с одинаковым набором алертов
+    (и локалью) получают одно и то же сообщение; каждое событие рендерится
+    не больше раза на локаль.
+    """
+
+    def __init__(self, deliver, recipients, window: float = 0, cooldown: float = 60, max_lines: int = 30,
+                 renderer: MessageRenderer = None, locale_of=None):
+        self.deliver = deliver          # async callable(text, chat_ids)
+        self.recipients = recipients    # callable(topic, symbol, value) -> chat_ids
+        self.window = window
+        self.cooldown = cooldown
+        self.max_lines = max_lines
+        self.renderer = renderer or MessageRenderer()
+        self.locale_of = locale_of      # callable(chat_id) -> локаль; None — локаль по умолчанию
+
+        self.pending = {}               # (kind, symbol) -> alert
+        self.cooldown_until = {}        # (kind, symbol, chat_id) -> до какого времени молчим
+        self.suppressed = 0
+        self._window_start = 0.0
+        self._next_prune = 0.0
+
+    def add(self, kind: str, topic: str, group: str, symbol: str, value: float, event,
+            now: float = None, cooldown: float = None) -> bool:
+        """Добавляет алерт в текущую пачку; False — в пачке уже есть более сильный дубль.
+
+        kind — ключ кулдауна, topic — тип для подписок, group — по нему алерты
+        одного символа схлопываются в самый сильный, event — (шаблон, поля)
+        для MessageRenderer. Кулдаун проверяется при отправке, по каждому чату.
+        """
+        now = now or time.time()
+        key = (kind, symbol)
+        current = self.pending.get(key)
+        if current and abs(current["value"]) >= abs(value):
+            self.suppressed += 1
+            ALERTS_SUPPRESSED.inc(reason="duplicate")
+            return False
+
+        if not self.pending:
+            self._window_start = now
+        self.pending[key] = {
+            "kind": kind, "topic": topic, "group": group, "symbol": symbol, "value": value,
+            "cooldown": self.cooldown if cooldown is None else cooldown, "event": event, "rendered": {},
+        }
+        return True
+
+    async def flush(self, now: float = None):
+        """Отправляет накопленное, если окно закрылось"""
+        now = now or time.time()
+        if not self.pending or now - self._window_start < self.window:
+            return
+
+        alerts = sorted(self.pending.values(), key=lambda a: abs(a["value"]), reverse=True)
+        self.pending = {}
+        self._prune(now)
+
+        # Самый сильный алерт каждой группы символа, у которого у чата нет кулдауна
+        per_chat = {}
+        cooldown_until = self.cooldown_until
+        for number, alert in enumerate(alerts):
+            kind, symbol = alert["kind"], alert["symbol"]
+            slot = (alert["group"], symbol)
+            for chat_id in self.recipients(alert["topic"], symbol, alert["value"]):
+                key = (kind, symbol, chat_id)
+                if cooldown_until.get(key, 0) > now:
+                    self.suppressed += 1
+                    ALERTS_SUPPRESSED.inc(reason="cooldown")
+                    continue
+                # слабые алерты группы схлопнуты в сильнейший — кулдаун и для них
+                cooldown_until[key] = now + alert["cooldown"]
+                chosen = per_chat.setdefault(chat_id, {})
+                if slot not in chosen:
+                    chosen[slot] = number   # alerts отсортированы — первый и есть сильнейший
+
+        # Одинаковые наборы алертов в одной локали — одно сообщение на всех
+        audiences = {}
+        locale_of = self.locale_of
+        for chat_id, chosen in per_chat.items():
+            key = (tuple(sorted(chosen.values())), locale_of(chat_id) if locale_of else None)
+            audiences.setdefault(key, []).append(chat_id)
+
+        for (numbers, locale), chat_ids in audiences.items():
+            selected = [alerts[n] for n in numbers]
+            if len(selected) == 1:
+                await self.deliver(self.render(selected[0], locale).text, chat_ids)
+            else:
+                await self.deliver(self.render_digest(selected, locale), chat_ids)
+                DIGESTS.inc()
+                print(f"📦 Дайджест: {len(selected)} алертов → {len(chat_ids)} чатов")
+
+    def _prune(self, now: float):
+        """Раз в минуту выкидывает истёкшие кулдауны"""
+        if now < self._next_prune:
+            return
+        self._next_prune = now + 60
+        self.cooldown_until = {key: until for key, until in self.cooldown_until.items() if until > now}
+
+    def render(self, alert: dict, locale: str = None):
+        """Сообщение алерта в локали — рендерится один раз, дальше из кэша алерта"""
+        rendered = alert["rendered"].get(locale)
+        if rendered is None:
+            rendered = alert["rendered"][locale] = self.renderer.render(alert["event"], locale)
+        return rendered
+
+    def render_digest(self, alerts: list, locale: str = None) -> str:
+        lines = [self.render(alert, locale).line for alert in alerts[:self.max_lines]]
+        return self.renderer.digest(lines, len(alerts), locale)
+
+
+class AlertPublisher:
+    """События детектора → алерты в AlertBatcher.
+
+    Текст здесь не собирается: в батчер уходит событие (шаблон, поля), его
+    рендерит MessageRenderer на стороне рассылки — один раз на событие и локаль.
+    Поля — только JSON-совместимые значения, чтобы события шли и от воркеров.
+    """
+
+    def __init__(self, batcher: AlertBatcher, check_interval: float, timeframe: int, oi_cooldown: float = 300):
+        self.batcher = batcher
+        self.check_interval = check_interval
+        self.timeframe = timeframe
+        self.oi_cooldown = oi_cooldown      # секунды между OI-алертами по монете одному чату
+
+    async def price_alert(self, symbol: str, price_change: float, current_time: float, start_time: float,
+                          funding: dict = None, oi: float = None, oi_change: float = None, alert_type: str = "НАКОПЛЕНО",
+                          window: int = None):
+        """Отправка уведомления об изменении цены"""
+        window = window or self.timeframe
+        instant = alert_type == "МГНОВЕННО"
+        fields = {
+            "symbol": symbol, "price_change": price_change, "alert_type": alert_type, "instant": instant,
+            "elapsed": max(0.1, current_time - start_time), "window": window, "now": current_time,
+            "oi": oi, "oi_change": oi_change,
+            "funding_rate": funding["rate"] if funding else None,
+            "funding_next": funding.get("next_time") if funding else None,
+        }
+
+        kind = alert_type if instant else f"{alert_type} {window}м"
+        topic = "instant" if instant else "price"
+        if topic == "price":
+            ALERTS.inc(type=topic, window=f"{window}m")
+        else:
+            ALERTS.inc(type=topic)
+        if self.batcher.add(kind, topic, "price", symbol, price_change, ("price", fields), now=current_time):
+            print(f"✅ {alert_type} Цена: {symbol} {price_change:+.2f}%")
+
+    async def oi_alert(self, symbol: str, oi_change: float, current_time: float,
+                       current_oi: float, funding: dict = None, price_change: float = None):
+        """Отправка уведомления о росте Open Interest (упрощенная версия)"""
+        fields = {
+            "symbol": symbol, "oi_change": oi_change, "oi": current_oi, "price_change": price_change,
+            "interval": self.check_interval, "now": current_time,
+            "funding_rate": funding["rate"] if funding else None,
+            "funding_next": funding.get("next_time") if funding else None,
+        }
+
+        ALERTS.inc(type="oi")
+        if self.batcher.add("OI", "oi", "oi", symbol, oi_change, ("oi", fields), now=current_time,
+                            cooldown=self.oi_cooldown):
+            print(f"✅ OI РОСТ: {symbol} +{oi_change:+.2f}%")
+
+    async def rule_alert(self, symbol: str, rule: str, values: list, current_time: float):
+        """Сработало составное правило; values — [(метрика, значение)] в порядке правила"""
+        fields = {"symbol": symbol, "rule": rule, "values": values, "now": current_time}
+        # сила алерта для склейки — первая известная метрика правила
+        strength = next((value for _, value in values if value == value), 0.0)
+        topic = RULE_TOPIC + rule
+        ALERTS.inc(type="rule")
+        if self.batcher.add(topic, topic, topic, symbol, strength, ("rule", fields), now=current_time):
+            print(f"✅ Правило: {symbol} {rule}")
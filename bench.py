@@ -0,0 +1,179 @@
+"""Офлайн-бенчмарк детекции: replay записи рынка (или синтетики) без сети.
+
+    python bench.py                          # синтетический рынок
+    python bench.py market.rec --speed 0     # запись, снятая с RECORD_FILE
+    python bench.py --chats 1000 --alloc     # + аллокации на тик (tracemalloc)
+    python bench.py --render 100000          # только рендер сообщений
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+import tracemalloc
+
+from alerts import AlertBatcher, AlertPublisher
+from delivery import AlertSender
+from detector import Detector
+from replay import FakeBot, read_recording, replay, synthetic_frames
+from templates import MessageRenderer
+
+# Пороги как в main.py
+WINDOWS = {60: 5, 300: 7, 900: 10, 3600: 15}
+THRESHOLDS = {"instant": 3, "price": 0, "oi": 5}
+TICK = 1.0
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def run(frames, chats: int, speed: float, alloc: bool) -> dict:
+    chat_ids = list(range(1, chats + 1))
+    enqueued = {}           # текст -> perf_counter начала тика, породившего алерт
+    latencies = []
+    detect_times = []
+    alloc_peaks = []
+    tick_started = 0.0
+
+    def on_send(chat_id, text):
+        latencies.append(time.perf_counter() - enqueued[text])
+
+    bot = FakeBot(on_send)
+    sender = AlertSender(bot, workers=4, global_rate=1e9, per_chat_interval=0)
+
+    async def deliver(text, recipients):
+        enqueued.setdefault(text, tick_started)
+        sender.broadcast(text, recipients)
+
+    batcher = AlertBatcher(deliver, lambda topic, symbol, value: chat_ids, cooldown=60)
+    publisher = AlertPublisher(batcher, TICK, 15)
+    detector = Detector(
+        publisher.price_alert, publisher.oi_alert, WINDOWS, THRESHOLDS.get,
+        {}, {}, TICK, 900
+    )
+
+    class TimedDetector:
+        """Отмечает начало тика для замера time-to-alert"""
+
+        def __init__(self, inner):
+            self.inner = inner
+            self.oi_values = inner.oi_values
+            self.funding_rates = inner.funding_rates
+
+        async def process_prices(self, prices, ts):
+            nonlocal tick_started
+            tick_started = time.perf_counter()
+            if alloc:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            await self.inner.process_prices(prices, ts)
+            if alloc:
+                alloc_peaks.append(tracemalloc.get_traced_memory()[1] - before)
+
+        async def process_oi(self, symbols, ts):
+            await self.inner.process_oi(symbols, ts)
+
+    async def after_tick(ts, detect_seconds):
+        detect_times.append(detect_seconds)
+        await batcher.flush(ts)
+        await asyncio.sleep(0)      # даём воркерам рассылки поработать
+
+    if alloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await replay(frames, TimedDetector(detector), after_tick, speed)
+    await sender.queue.join()
+    elapsed = time.perf_counter() - started
+    if alloc:
+        tracemalloc.stop()
+    await sender.stop()
+
+    ticks = len(detect_times)
+    return {
+        "ticks": ticks,
+        "symbols": len(detector),
+        "seconds": elapsed,
+        "ticks_per_sec": ticks / elapsed if elapsed else 0.0,
+        "detect_mean_us": sum(detect_times) / ticks * 1e6 if ticks else 0.0,
+        "detect_p99_us": percentile(detect_times, 99) * 1e6,
+        "messages": bot.sent,
+        "alert_p50_ms": percentile(latencies, 50) * 1e3,
+        "alert_p99_ms": percentile(latencies, 99) * 1e3,
+        "alloc_kb_per_tick": sum(alloc_peaks) / len(alloc_peaks) / 1024 if alloc_peaks else None,
+    }
+
+
+def bench_render(count: int) -> dict:
+    """Рендер событий алертов отдельно от детекции и рассылки"""
+    renderer = MessageRenderer()
+    now = time.time()
+    funding = {"funding_rate": 0.0125, "funding_next": (now + 3600) * 1000}
+    events = [
+        ("price", {"symbol": "BTCUSDT", "price_change": 3.21, "alert_type": "МГНОВЕННО", "instant": True,
+                   "elapsed": 4.0, "window": 15, "now": now, "oi": 1.2e9, "oi_change": 0.8, **funding}),
+        ("price", {"symbol": "ETHUSDT", "price_change": -7.4, "alert_type": "НАКОПЛЕНО", "instant": False,
+                   "elapsed": 240.0, "window": 5, "now": now, "oi": None, "oi_change": None,
+                   "funding_rate": None, "funding_next": None}),
+        ("oi", {"symbol": "SOLUSDT", "oi_change": 6.1, "oi": 3.4e7, "price_change": 1.2,
+                "interval": TICK, "now": now, **funding}),
+    ]
+    started = time.perf_counter()
+    for i in range(count):
+        renderer.render(events[i % len(events)])
+    elapsed = time.perf_counter() - started
+
+    lines = [renderer.render(event).line for event in events] * 10
+    started = time.perf_counter()
+    for _ in range(count // 10):
+        renderer.digest(lines, len(lines))
+    digest_elapsed = time.perf_counter() - started
+    return {
+        "render_us": elapsed / count * 1e6 if count else 0.0,
+        "digest_us": digest_elapsed / (count // 10) * 1e6 if count >= 10 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк track_changes")
+    parser.add_argument("recording", nargs="?", help="файл записи (RECORD_FILE); без него — синтетика")
+    parser.add_argument("--ticks", type=int, default=3000, help="тиков синтетики")
+    parser.add_argument("--symbols", type=int, default=300, help="монет синтетики")
+    parser.add_argument("--chats", type=int, default=100, help="фиктивных подписчиков")
+    parser.add_argument("--speed", type=float, default=0, help="ускорение replay (0 — без пауз)")
+    parser.add_argument("--alloc", action="store_true", help="замерять аллокации (медленнее)")
+    parser.add_argument("--render", type=int, metavar="N", help="замерить только рендер N сообщений")
+    args = parser.parse_args()
+
+    if args.render:
+        result = bench_render(args.render)
+        print(f"Рендер алерта:      {result['render_us']:.2f} мкс")
+        print(f"Рендер дайджеста:   {result['digest_us']:.2f} мкс (30 строк)")
+        return
+
+    if args.recording:
+        if not os.path.exists(args.recording):
+            parser.error(f"нет файла {args.recording}")
+        frames = read_recording(args.recording)
+    else:
+        frames = synthetic_frames(args.symbols, args.ticks, TICK)
+
+    # Логи алертов и рассылки не нужны в замере
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(run(frames, args.chats, args.speed, args.alloc))
+
+    print(f"Тиков:              {result['ticks']} ({result['symbols']} монет) за {result['seconds']:.2f}с")
+    print(f"Тиков в секунду:    {result['ticks_per_sec']:.0f}")
+    print(f"Детекция на тик:    {result['detect_mean_us']:.0f} мкс (p99 {result['detect_p99_us']:.0f} мкс)")
+    print(f"Сообщений:          {result['messages']}")
+    print(f"Time-to-alert:      p50 {result['alert_p50_ms']:.2f} мс, p99 {result['alert_p99_ms']:.2f} мс")
+    if result["alloc_kb_per_tick"] is not None:
+        print(f"Аллокации на тик:   {result['alloc_kb_per_tick']:.1f} KB (пик tracemalloc)")
+
+
+if __name__ == "__main__":
+    main()
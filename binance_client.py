@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import ClientTimeout, TCPConnector
+
+import metrics
+
+FAPI_BASE_URL = "https://fapi.binance.com"
+WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+
+REQUEST_SECONDS = metrics.histogram("binance_request_seconds", "Время REST-запроса к Binance")
+RATE_LIMITED = metrics.counter("binance_rate_limited_total", "Ответы 429/418 от Binance")
+
+
+class RateLimitError(Exception):
+    """Binance ответил 429/418 — запросы приостановлены на retry_after секунд"""
+
+    def __init__(self, status: int, retry_after: int):
+        super().__init__(f"HTTP {status}, retry after {retry_after}s")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class BinanceClient:
+    """Долгоживущий HTTP-клиент Binance с пулом соединений.
+
+    Одна сессия на весь процесс: keep-alive, кэш DNS, лимит соединений на хост
+    и единые таймауты для всех запросов. Следит за бюджетом веса запросов
+    (X-MBX-USED-WEIGHT-1M) и не даёт его превысить.
+    """
+
+    def __init__(self, base_url: str = FAPI_BASE_URL, timeout: float = 5, limit: int = 100,
+                 limit_per_host: int = 50, dns_ttl: int = 300, keepalive: float = 60,
+                 weight_limit: int = 2400, weight_reserve: float = 0.2):
+        self.base_url = base_url
+        self.weight_limit = weight_limit
+        self.weight_reserve = weight_reserve    # доля лимита, которую не трогаем
+        self.used_weight = 0
+        self.paused_until = 0.0
+        self._weight_minute = 0
+        self.timeout = ClientTimeout(total=timeout)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=self.dns_ttl,
+                    keepalive_timeout=self.keepalive,
+                ),
+                timeout=self.timeout,
+            )
+        return self._session
+
+    async def start(self):
+        """Создаёт сессию заранее, чтобы первый запрос не платил за инициализацию"""
+        return self.session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            # даём коннектору закрыть TLS-соединения
+            await asyncio.sleep(0.25)
+        self._session = None
+
+    def get(self, path: str, params: dict = None):
+        """GET к Binance: `async with client.get(path, params) as response:`"""
+        return self.session.get(self.base_url + path, params=params)
+
+    async def get_json(self, path: str, params: dict = None, weight: int = 1):
+        """GET с учётом бюджета веса; при 429/418 бросает RateLimitError"""
+        await self.acquire(weight)
+        started = time.perf_counter()
+        async with self.get(path, params) as response:
+            self._update_weight(response)
+            if response.status in (418, 429):
+                RATE_LIMITED.inc(status=response.status)
+                retry_after = int(response.headers.get("Retry-After", 60))
+                self.paused_until = max(self.paused_until, time.time() + retry_after)
+                raise RateLimitError(response.status, retry_after)
+            response.raise_for_status()
+            data = await response.json()
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=path)
+        return data
+
+    # ── Бюджет веса ─────────────────────────────────────────────────────────
+    @property
+    def weight_budget(self) -> int:
+        return int(self.weight_limit * (1 - self.weight_reserve))
+
+    async def acquire(self, weight: int = 1):
+        """Ждёт, пока запрос весом `weight` уложится в минутный бюджет"""
+        while True:
+            now = time.time()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._roll_minute(now)
+            if self.used_weight + weight <= self.weight_budget:
+                self.used_weight += weight  # резервируем до ответа с точным значением
+                return
+            await asyncio.sleep(60 - now % 60 + 0.05)
+
+    def _roll_minute(self, now: float):
+        minute = int(now // 60)
+        if minute != self._weight_minute:
+            self._weight_minute = minute
+            self.used_weight = 0
+
+    def _update_weight(self, response: aiohttp.ClientResponse):
+        used = response.headers.get(WEIGHT_HEADER)
+        if used is not None:
+            self._roll_minute(time.time())
+            self.used_weight = max(self.used_weight, int(used))
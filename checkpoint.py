@@ -0,0 +1,257 @@
+import asyncio
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+MAGIC = b"TRS3"
+
+_HEADER = struct.Struct("<dI")          # время снимка, число символов
+_COUNT = struct.Struct("<I")
+_LENGTH = struct.Struct("<B")
+_WINDOW = struct.Struct("<II")          # точек в деке минимумов, максимумов
+_VALUE = struct.Struct("<Id")           # id символа, значение
+_COOLDOWN = struct.Struct("<Iqd")       # id символа, chat_id, конец кулдауна
+_SECONDS = struct.Struct("<d")          # длина окна
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def count(self) -> int:
+        return self.unpack(_COUNT)[0]
+
+    def string(self) -> str:
+        length = self.unpack(_LENGTH)[0]
+        self.offset += length
+        return self.data[self.offset - length:self.offset].decode()
+
+    def floats(self, count: int) -> np.ndarray:
+        array = np.frombuffer(self.data, dtype="<f8", count=count, offset=self.offset)
+        self.offset += 8 * count
+        return array
+
+    def ids(self) -> list:
+        count = self.count()
+        array = np.frombuffer(self.data, dtype="<u4", count=count, offset=self.offset)
+        self.offset += 4 * count
+        return array.tolist()
+
+    def values(self) -> list:
+        count = self.count()
+        data = self.data[self.offset:self.offset + _VALUE.size * count]
+        self.offset += len(data)
+        return list(_VALUE.iter_unpack(data))
+
+
+def _dump_windows(engine, symbol_id) -> list:
+    """Длины окон движка и деки всех символов; engine None — пустая секция"""
+    if engine is None:
+        return [_COUNT.pack(0), _COUNT.pack(0)]
+    lengths = [length for length, _ in engine.windows]
+    chunks = [_COUNT.pack(len(lengths))]
+    chunks.extend(_SECONDS.pack(length) for length in lengths)
+    chunks.append(_COUNT.pack(len(engine.state)))
+    for symbol, windows in engine.state.items():
+        chunks.append(_COUNT.pack(symbol_id(symbol)))
+        for window in windows:
+            chunks.append(_WINDOW.pack(len(window.mins), len(window.maxs)))
+            points = [value for point in window.mins for value in point]
+            points += [value for point in window.maxs for value in point]
+            chunks.append(np.array(points, dtype="<f8").tobytes())
+    return chunks
+
+
+def _load_windows(reader: _Reader, engine, symbols: list, now: float) -> int:
+    """Деки окон, которые есть в движке сейчас; остальные пропускаются"""
+    lengths = [reader.unpack(_SECONDS)[0] for _ in range(reader.count())]
+    known = {length for length, _ in engine.windows} if engine is not None else set()
+    restored = 0
+    for _ in range(reader.count()):
+        symbol = symbols[reader.count()]
+        for length in lengths:
+            n_mins, n_maxs = reader.unpack(_WINDOW)
+            points = reader.floats(2 * (n_mins + n_maxs)).reshape(-1, 2).tolist()
+            if length in known:
+                engine.load(symbol, length, [tuple(p) for p in points[:n_mins]],
+                            [tuple(p) for p in points[n_mins:]], now)
+                restored += 1
+    return restored
+
+
+class StateCheckpoint:
+    """Снимок состояния детекции на диск и тёплый старт после рестарта.
+
+    В снимок попадают цены детектора, деки скользящих окон (алертов и правил),
+    последние OI, истинные сейчас правила и кулдауны алертов по чатам
+    (AlertBatcher). При загрузке всё проверяется на свежесть: цены — не старше
+    `max_price_age`, OI и правила — не старше `max_oi_age`, точки окон — не
+    старше своего окна, кулдауны — только ещё действующие. Окна и правила
+    поднимаются только те, что зарегистрированы в детекторе к моменту
+    загрузки (Detector.sync_rules до restore). Формат — бинарный (struct + numpy), сжатый zlib; запись атомарна.
+    """
+
+    def __init__(self, path: str, detector=None, batcher=None, interval: float = 30,
+                 max_price_age: float = 10, max_oi_age: float = 300):
+        self.path = path
+        self.detector = detector
+        self.batcher = batcher if hasattr(batcher, "cooldown_until") else None
+        self.interval = interval
+        self.max_price_age = max_price_age
+        self.max_oi_age = max_oi_age
+        self.saved = 0
+        self._task = None
+
+    # ── Запись ──────────────────────────────────────────────────────────────
+    def dump(self, now: float = None) -> bytes:
+        now = now or time.time()
+        detector = self.detector
+        ids = {}
+        symbols = []
+
+        def symbol_id(symbol: str) -> int:
+            i = ids.get(symbol)
+            if i is None:
+                i = ids[symbol] = len(symbols)
+                symbols.append(symbol)
+            return i
+
+        chunks = []
+        if detector is not None:
+            engine = detector.engine
+            rows = len(engine)
+            for symbol in engine.symbols:
+                symbol_id(symbol)
+            chunks += [_COUNT.pack(rows), engine.price[:rows].astype("<f8").tobytes(),
+                       engine.prev[:rows].astype("<f8").tobytes()]
+
+            chunks += _dump_windows(detector.windows, symbol_id)
+            chunks += _dump_windows(detector.rule_windows, symbol_id)
+
+            last_oi = detector.last_oi_values
+            chunks.append(_COUNT.pack(len(last_oi)))
+            chunks.extend(_VALUE.pack(symbol_id(symbol), value) for symbol, value in last_oi.items())
+
+            chunks.append(_COUNT.pack(len(detector._rule_active)))
+            for text, active in detector._rule_active.items():
+                name = text.encode()
+                active_ids = np.array([symbol_id(symbol) for symbol in active], dtype="<u4")
+                chunks += [_LENGTH.pack(len(name)) + name, _COUNT.pack(len(active_ids)), active_ids.tobytes()]
+        else:
+            chunks += [_COUNT.pack(0)] + _dump_windows(None, symbol_id) * 2 + [_COUNT.pack(0), _COUNT.pack(0)]
+
+        cooldowns = {key: until for key, until in self.batcher.cooldown_until.items()
+                     if until > now} if self.batcher else {}
+        chunks.append(_COUNT.pack(len(cooldowns)))
+        for (kind, symbol, chat_id), until in cooldowns.items():
+            name = kind.encode()
+            chunks.append(_LENGTH.pack(len(name)) + name + _COOLDOWN.pack(symbol_id(symbol), chat_id, until))
+
+        header = [_HEADER.pack(now, len(symbols))]
+        for symbol in symbols:
+            name = symbol.encode()
+            header.append(_LENGTH.pack(len(name)) + name)
+        return MAGIC + zlib.compress(b"".join(header + chunks), 1)
+
+    async def save(self):
+        """Снимок собирается в event loop (состояние не меняется на ходу), запись — в потоке"""
+        data = self.dump()
+        await asyncio.to_thread(self._write, data)
+        self.saved += 1
+
+    def _write(self, data: bytes):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    # ── Загрузка ────────────────────────────────────────────────────────────
+    def restore(self, now: float = None) -> bool:
+        """Поднимает состояние из файла; False — файла нет или он не читается"""
+        now = now or time.time()
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            if raw[:len(MAGIC)] != MAGIC:
+                raise ValueError("не снимок состояния")
+            self._load(_Reader(zlib.decompress(raw[len(MAGIC):])), now)
+            return True
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            print(f"⚠️ Снимок состояния {self.path} не загружен: {e}")
+            return False
+
+    def _load(self, reader: _Reader, now: float):
+        saved_at, count = reader.unpack(_HEADER)
+        symbols = [reader.string() for _ in range(count)]
+        age = now - saved_at
+        detector = self.detector
+
+        rows = reader.count()
+        price, prev = reader.floats(rows), reader.floats(rows)
+        if detector is not None and rows and age <= self.max_price_age:
+            detector.engine.load(symbols[:rows], price, prev)
+
+        restored_windows = _load_windows(reader, detector.windows if detector is not None else None, symbols, now)
+        restored_windows += _load_windows(reader, detector.rule_windows if detector is not None else None,
+                                          symbols, now)
+
+        last_oi = reader.values()
+        if detector is not None and age <= self.max_oi_age:
+            detector.last_oi_values.update((symbols[i], value) for i, value in last_oi)
+
+        # Правила, истинные на момент снимка, не срабатывают повторно после рестарта
+        restored_rules = 0
+        for _ in range(reader.count()):
+            text, ids = reader.string(), reader.ids()
+            active = detector._rule_active.get(text) if detector is not None else None
+            if active is not None and age <= self.max_oi_age:
+                active.update(symbols[i] for i in ids)
+                restored_rules += len(ids)
+
+        restored_sent = 0
+        for _ in range(reader.count()):
+            kind = reader.string()
+            i, chat_id, until = reader.unpack(_COOLDOWN)
+            if self.batcher and until > now:
+                self.batcher.cooldown_until[(kind, symbols[i], chat_id)] = until
+                restored_sent += 1
+
+        print(f"♻️ Состояние восстановлено ({age:.0f}с назад): окон {restored_windows}, "
+              f"OI {len(detector.last_oi_values) if detector is not None else 0}, правил {restored_rules}, "
+              f"кулдаунов {restored_sent}")
+
+    # ── Периодический снимок ────────────────────────────────────────────────
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+        return self._task
+
+    async def stop(self):
+        """Останавливает периодические снимки и пишет последний"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception as e:
+                print(f"⚠️ Ошибка снимка состояния: {e}")
@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import metrics
+
+SEND_SECONDS = metrics.histogram("telegram_send_seconds", "Время отправки сообщения в Telegram")
+SEND_FAILURES = metrics.counter("telegram_send_failures_total", "Неудачные отправки в Telegram")
+
+
+class TokenBucket:
+    """Ограничитель частоты: `rate` токенов в секунду, запас не больше `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Не выдавать токены `seconds` секунд (flood control Telegram на всего бота); после — без запаса"""
+        until = time.monotonic() + seconds
+        if until > self.paused_until:
+            self.paused_until = until
+            self.tokens = 0
+            self.updated = until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AlertSender:
+    """Неблокирующая рассылка сообщений в Telegram.
+
+    Детектор кладёт сообщение в очередь и сразу продолжает работу; отправляют
+    воркеры. Соблюдаются глобальный лимит Telegram (~30 msg/s) и лимит на чат
+    (1 msg/s). 429 во время рассылки — обычно flood limit всего бота: на
+    retry_after встаёт весь глобальный лимит, а сообщение ставится в очередь заново.
+    """
+
+    def __init__(self, bot, workers: int = 8, global_rate: float = 30, per_chat_interval: float = 1.0,
+                 max_attempts: int = 3, on_chat_gone=None):
+        self.bot = bot
+        self.workers = workers
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self.on_chat_gone = on_chat_gone        # callback(chat_id) для заблокировавших бота
+        self.bucket = TokenBucket(global_rate)
+
+        self.queue = asyncio.Queue()
+        self.sent = 0
+        self.failed = 0
+        self._chat_ready = {}                   # chat_id -> monotonic-время, когда можно слать
+        self._delayed = 0                       # сообщения, ожидающие повторной постановки
+        self._tasks = []
+
+    @property
+    def pending(self) -> int:
+        return self.queue.qsize() + self._delayed
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 5):
+        """Даёт воркерам дослать очередь и останавливает их"""
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self.queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ Не досланы {self.pending} сообщений")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def broadcast(self, text: str, chat_ids):
+        """Ставит сообщение в очередь для каждого чата и сразу возвращается"""
+        self.start()
+        for chat_id in chat_ids:
+            self.queue.put_nowait((chat_id, text, 1))
+
+    def _requeue(self, item, delay: float):
+        self._delayed += 1
+
+        def put():
+            self._delayed -= 1
+            self.queue.put_nowait(item)
+
+        asyncio.get_running_loop().call_later(delay, put)
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                await self._deliver(item)
+            except Exception as e:
+                print(f"❌ Ошибка воркера рассылки: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, item):
+        chat_id, text, attempt = item
+
+        wait = self._chat_ready.get(chat_id, 0) - time.monotonic()
+        if wait > 0:
+            self._requeue(item, wait)
+            return
+        self._chat_ready[chat_id] = time.monotonic() + self.per_chat_interval
+
+        await self.bucket.acquire()
+        started = time.perf_counter()
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text)
+            SEND_SECONDS.observe(time.perf_counter() - started)
+            self.sent += 1
+            print(f"✅ Отправлено в {chat_id}")
+        except TelegramRetryAfter as e:
+            SEND_FAILURES.inc(reason="retry_after")
+            print(f"⚠️ Telegram flood control ({chat_id}): пауза рассылки {e.retry_after}с")
+            self.bucket.pause(e.retry_after)
+            self._chat_ready[chat_id] = time.monotonic() + e.retry_after
+            self._requeue(item, e.retry_after)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            SEND_FAILURES.inc(reason=type(e).__name__)
+            self.failed += 1
+            print(f"❌ Ошибка отправки в {chat_id}: {e}")
+            if isinstance(e, TelegramForbiddenError) or "chat not found" in str(e).lower():
+                if self.on_chat_gone:
+                    self.on_chat_gone(chat_id)
+        except Exception as e:
+            SEND_FAILURES.inc(reason="error")
+            print(f"❌ Ошибка отправки в {chat_id}: {e}")
+            if attempt < self.max_attempts:
+                self._requeue((chat_id, text, attempt + 1), 2 ** attempt)
+            else:
+                self.failed += 1
@@ -0,0 +1,199 @@
+from bisect import bisect_left
+from collections import deque
+
+import numpy as np
+
+from rules import Rule, RulePlan, metric_name
+from snapshot import SnapshotEngine
+from window import WindowEngine
+
+
+class Detector:
+    """Детекция алертов по снапшотам цен и OI — без сети и Telegram.
+
+    Живой трекинг и replay-стенд кормят его одинаково: process_prices на
+    каждый снапшот цен, process_oi на свежие значения OI. Сработавшие алерты
+    уходят в колбэки on_price_alert / on_oi_alert (см. AlertPublisher).
+    Составные правила пользователей (rules.py) проверяются в process_prices
+    по монетам, у которых с прошлого тика изменилась цена или OI; правило
+    срабатывает при переходе из «ложно» в «истинно».
+    """
+
+    def __init__(self, on_price_alert, on_oi_alert, windows: dict, thresholds,
+                 oi_values: dict, funding_rates: dict, tick_interval: float,
+                 main_window: float, rules=None, on_rule_alert=None):
+        self.on_price_alert = on_price_alert
+        self.on_oi_alert = on_oi_alert
+        self.thresholds = thresholds        # callable(kind) -> минимальный порог
+        self.oi_values = oi_values          # общие словари фонового загрузчика
+        self.funding_rates = funding_rates
+        self.tick_interval = tick_interval
+        self.main_window = main_window      # окно (сек), движение в котором показываем в OI-алерте
+
+        # Цены и предыдущие цены — колонками для пакетного расчёта
+        self.engine = SnapshotEngine()
+        # Реальное изменение цены в скользящих окнах, {секунды: порог}
+        self.windows = WindowEngine(windows)
+        # Окна для правил "price <окно>" — свои, без порогов: алерты их не сбрасывают
+        self.rule_windows = WindowEngine({})
+
+        # ПРОСТАЯ ЛОГИКА ДЛЯ OI
+        self.last_oi_values = {}    # Предыдущие значения OI
+
+        # Составные правила
+        self.rules = rules                  # callable() -> тексты правил подписчиков
+        self.on_rule_alert = on_rule_alert
+        self.plan = None
+        self._rule_texts = ()
+        self._rule_active = {}              # текст правила -> символы, где оно сейчас истинно
+        self._dirty = set()                 # символы, которые надо перепроверить правилами
+        self.oi_growth = {}                 # symbol -> рост OI с прошлого опроса, %
+        self.oi_history = {}                # symbol -> deque[(ts, OI)] для правил "oi <окно>"
+        self._oi_span = 0
+
+    def __len__(self):
+        return len(self.engine)
+
+    async def process_prices(self, prices: dict, current_time: float):
+        self.sync_rules()
+        # Мгновенные изменения — одним проходом по всем монетам,
+        # окна обновляются только для монет с новой ценой
+        triggered = self.engine.update(prices, self.thresholds("instant"))
+        window_hits = self.windows.update(triggered["changed"], current_time)
+        if self.plan:
+            self.rule_windows.update(triggered["changed"], current_time)
+            self._dirty.update(symbol for symbol, _, _ in triggered["changed"])
+
+        # ---- МГНОВЕННЫЙ АЛЕРТ ЦЕНЫ ----
+        for symbol, instant_change in triggered["instant"]:
+            await self.on_price_alert(
+                symbol,
+                instant_change,
+                current_time,
+                current_time - self.tick_interval,
+                self.funding_rates.get(symbol, {"rate": 0}),
+                self.oi_values.get(symbol, 0),
+                0,
+                "МГНОВЕННО"
+            )
+
+        # ---- НАКОПЛЕННЫЙ АЛЕРТ ЦЕНЫ (скользящие окна) ----
+        for symbol, length, window_change, start_time in window_hits:
+            await self.on_price_alert(
+                symbol,
+                window_change,
+                current_time,
+                start_time,
+                self.funding_rates.get(symbol, {"rate": 0}),
+                self.oi_values.get(symbol, 0),
+                0,
+                "НАКОПЛЕНО",
+                int(length // 60)
+            )
+
+        if self._dirty:
+            await self._process_rules(current_time)
+
+    async def process_oi(self, symbols, current_time: float):
+        """Проверка роста OI по символам, для которых пришло новое значение"""
+        for symbol in symbols:
+            current_oi = self.oi_values[symbol]
+
+            # Проверяем рост от предыдущего значения
+            if symbol in self.last_oi_values:
+                last_oi = self.last_oi_values[symbol]
+                if last_oi > 0:
+                    oi_growth = ((current_oi - last_oi) / last_oi) * 100
+                    self.oi_growth[symbol] = oi_growth
+
+                    # Если рост достиг порога (кулдаун по каждому чату — в AlertBatcher)
+                    if oi_growth >= self.thresholds("oi"):
+                        print(f"🔔 OI РОСТ {symbol}: {oi_growth:.2f}%")
+                        await self.on_oi_alert(
+                            symbol,
+                            oi_growth,
+                            current_time,
+                            current_oi,
+                            self.funding_rates.get(symbol, {"rate": 0}),
+                            self.windows.move_of(symbol, self.main_window, current_time)
+                        )
+
+            # Обновляем предыдущее значение
+            self.last_oi_values[symbol] = current_oi
+
+            if self.plan:
+                self._dirty.add(symbol)
+                if self._oi_span:
+                    history = self.oi_history.setdefault(symbol, deque())
+                    history.append((current_time, current_oi))
+                    while history[0][0] < current_time - self._oi_span:
+                        history.popleft()
+
+    # ── Составные правила ───────────────────────────────────────────────────
+    def sync_rules(self):
+        """Перекомпилирует план, если набор правил подписчиков изменился.
+
+        Вызывается на каждый тик, а при старте — до восстановления снимка
+        состояния, чтобы окна и состояние правил было куда загрузить.
+        """
+        texts = tuple(self.rules()) if self.rules else ()
+        if texts == self._rule_texts:
+            return
+        self._rule_texts = texts
+        rules = []
+        for text in texts:
+            try:
+                rules.append(Rule(text))
+            except ValueError as e:
+                print(f"⚠️ Правило пропущено ({text}): {e}")
+        self.plan = RulePlan(rules) if rules else None
+        # окна правил — ровно те, что нужны текущим правилам
+        needed = self.plan.windows("price") if self.plan else set()
+        for length, _ in list(self.rule_windows.windows):
+            if length not in needed:
+                self.rule_windows.remove_window(length)
+        for length in needed:
+            self.rule_windows.add_window(length)
+        if not self.plan:
+            self._rule_active, self._dirty = {}, set()
+            return
+        self._oi_span = max(self.plan.windows("oi"), default=0)
+        self._rule_active = {rule.text: self._rule_active.get(rule.text, set()) for rule, _, _ in self.plan.rules}
+        print(f"🧩 Правил: {len(rules)}, метрик: {len(self.plan.metrics)}, сравнений: {len(self.plan.predicates)}")
+
+    def _metric(self, symbol: str, metric: tuple, now: float) -> float:
+        kind, window = metric
+        if kind == "price":
+            return self.rule_windows.move_of(symbol, window, now, np.nan)
+        if kind == "funding":
+            return self.funding_rates.get(symbol, {}).get("rate", np.nan)
+        if not window:
+            return self.oi_growth.get(symbol, np.nan)
+        history = self.oi_history.get(symbol)
+        start = bisect_left(history, (now - window,)) if history else 0
+        if not history or start == len(history):
+            return np.nan
+        first = history[start][1]
+        return (history[-1][1] - first) / first * 100 if first > 0 else np.nan
+
+    async def _process_rules(self, current_time: float):
+        """Все правила сразу по изменившимся монетам: метрики и сравнения — по одному разу"""
+        symbols = list(self._dirty)
+        self._dirty.clear()
+        plan = self.plan
+        values = np.array([[self._metric(symbol, metric, current_time) for metric in plan.metrics]
+                           for symbol in symbols], dtype=float)
+        for (rule, _, metric_ids), hits in zip(plan.rules, plan.evaluate(values)):
+            active = self._rule_active[rule.text]
+            for i, hit in enumerate(hits):
+                symbol = symbols[i]
+                if not hit:
+                    active.discard(symbol)
+                elif symbol not in active:
+                    active.add(symbol)
+                    if self.on_rule_alert:
+                        await self.on_rule_alert(
+                            symbol, rule.text,
+                            [(metric_name(plan.metrics[m]), float(values[i, m])) for m in metric_ids],
+                            current_time
+                        )
@@ -0,0 +1,311 @@
+import asyncio
+import time
+
+from binance_client import BinanceClient, RateLimitError
+from ws_feed import BinanceStream
+
+
+class MarketState:
+    """Общая карта цен всех рынков: нормализованный символ -> цена.
+
+    Символы основного рынка (Binance USDT-M) хранятся как есть, остальных —
+    с префиксом рынка: "SPOT:BTCUSDT", "COINM:BTCUSD_PERP", "BYBIT:BTCUSDT".
+    Адаптеры пишут сюда каждый из своей задачи только изменившиеся цены. Тик
+    трекинга задаёт основной рынок: остальные рынки попадают в детекцию с его
+    шагом, и горизонт мгновенного изменения у всех одинаковый.
+    """
+
+    def __init__(self):
+        self.prices = {}
+        self._updated = asyncio.Event()
+
+    def publish(self, feed: "FeedAdapter", prices: dict):
+        if feed.prefix:
+            keys = feed.keys
+            for symbol, price in prices.items():
+                key = keys.get(symbol)
+                if key is None:
+                    key = keys[symbol] = feed.prefix + symbol
+                self.prices[key] = price
+        else:
+            self.prices.update(prices)
+            if prices:
+                self._updated.set()
+
+    async def wait_prices(self, timeout: float = 5) -> dict:
+        """Ждёт обновления основного рынка (или `timeout`) и возвращает общую карту цен.
+
+        Без копии: карта читается до следующего await и между тиками не хранится.
+        """
+        try:
+            await asyncio.wait_for(self._updated.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._updated.clear()
+        return self.prices
+
+
+class FeedAdapter:
+    """Один рынок: REST-снапшот + поток, в своей задаче и со своим бюджетом веса.
+
+    Подклассы задают адреса, фильтр символов и разбор тикеров. Без потока
+    (или если у рынка его нет) адаптер опрашивает REST раз в `poll_interval`.
+    После разрыва потока цены сверяются по REST-снапшоту.
+    """
+
+    name = ""
+    prefix = ""                 # префикс нормализованного символа, "" — основной рынок
+    base_url = ""
+    ws_url = None
+    streams = ()
+    ticker_path = ""
+    ticker_weight = 1
+    weight_limit = 2400
+
+    def __init__(self, state: MarketState, client: BinanceClient = None, use_stream: bool = True,
+                 poll_interval: float = 1.0, ws_url: str = None, timeout: float = 5, limit_per_host: int = 10,
+                 symbol_filter=None, weight_share: float = 1.0):
+        self.state = state
+        self.ws_url = ws_url or self.ws_url     # можно указать локальный WS-стенд
+        self.symbol_filter = symbol_filter      # доп. фильтр, например символы своего шарда
+        # Свой клиент — свой пул соединений и свой минутный бюджет веса;
+        # основной рынок делит клиент с загрузкой OI/Funding того же API.
+        # weight_share — доля лимита IP, если рынок опрашивают несколько процессов
+        self.client = client or BinanceClient(
+            self.base_url, timeout=timeout, limit_per_host=limit_per_host,
+            weight_limit=int(self.weight_limit * weight_share)
+        )
+        self._own_client = client is None
+        self.poll_interval = poll_interval
+        self.stream = None
+        if use_stream and self.ws_url:
+            self.stream = BinanceStream(self.ws_url, self.streams, symbol_filter=self.accepts)
+        self.prices = {}        # последние цены рынка, symbol -> цена
+        self.volumes = {}       # symbol -> объём за 24ч (для приоритетов опроса OI)
+        self.times = {}         # symbol -> время цены последнего REST-снапшота (мс), если рынок его отдаёт
+        self.snapshot_taken = 0 # время запроса последнего REST-снапшота (мс)
+        self.keys = {}          # symbol -> нормализованный символ (кэш строк)
+        self.requests = 0
+        self._priming = None    # Event: стартовый REST-снимок запрошен и ещё не применён
+        self._task = None
+
+    @staticmethod
+    def is_tracked(symbol: str) -> bool:
+        return True
+
+    def accepts(self, symbol: str) -> bool:
+        return self.is_tracked(symbol) and (self.symbol_filter is None or self.symbol_filter(symbol))
+
+    def parse_ticker(self, data) -> dict:
+        """{symbol: цена} из ответа REST-тикера"""
+        raise NotImplementedError
+
+    async def snapshot(self) -> dict:
+        self.requests += 1
+        self.snapshot_taken = time.time() * 1000
+        try:
+            return self.parse_ticker(await self.client.get_json(self.ticker_path, weight=self.ticker_weight))
+        except RateLimitError as e:
+            print(f"⚠️ {self.name}: rate limit, ждем {e.retry_after}с")
+        except Exception as e:
+            print(f"⚠️ {self.name}: ошибка получения цен: {e}")
+        return {}
+
+    async def prime(self) -> dict:
+        """Один REST-снимок при старте, не дожидаясь первых кадров потока.
+
+        Он же закрывает стартовый разрыв потока: run() не запрашивает второй.
+        """
+        self._priming = asyncio.Event()
+        try:
+            snapshot = await self.snapshot()
+            if snapshot:
+                if self.stream:
+                    self.state.publish(self, self.stream.merge_snapshot(snapshot, self.times, self.snapshot_taken))
+                    self.stream.clear_initial_gap()
+                else:
+                    self.prices.update(snapshot)
+                    self.state.publish(self, snapshot)
+            return snapshot
+        finally:
+            self._priming.set()
+
+    @property
+    def connected(self) -> bool:
+        return self.stream is not None and self.stream.connected
+
+    def status(self) -> str:
+        ws = f" WS {'on' if self.connected else 'off'}/{self.stream.reconnects}" if self.stream else ""
+        return f"{self.name}: вес {self.client.used_weight}/{self.client.weight_limit}{ws}"
+
+    # ── Управление ──────────────────────────────────────────────────────────
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.stream:
+            await self.stream.stop()
+        if self._own_client:
+            await self.client.close()
+
+    async def run(self):
+        await self.client.start()
+        if self.stream is None:
+            while True:
+                snapshot = await self.snapshot()
+                self.prices.update(snapshot)
+                self.state.publish(self, snapshot)
+                await asyncio.sleep(self.poll_interval)
+
+        self.stream.session = self.client.session
+        self.prices = self.stream.prices
+        self.volumes = self.stream.volumes
+        self.stream.start()
+        while True:
+            # только цены, пришедшие с прошлого раза
+            prices = await self.stream.wait_prices(timeout=self.poll_interval * 10)
+            if self._priming:
+                await self._priming.wait()  # стартовый снимок уже в пути — ждём его, а не второй
+            if self.stream.consume_gap():
+                snapshot = await self.snapshot()
+                prices.update(self.stream.merge_snapshot(snapshot, self.times, self.snapshot_taken))
+            self.state.publish(self, prices)
+
+
+def _parse_binance_ticker(data: list, accepts, field: str, volumes: dict = None, times: dict = None) -> dict:
+    prices = {}
+    for item in data:
+        symbol = item.get("symbol")
+        if symbol and accepts(symbol):
+            try:
+                price = float(item[field])
+            except (KeyError, ValueError, TypeError):
+                continue
+            if price > 0:
+                prices[symbol] = price
+                if volumes is not None:
+                    volumes[symbol] = float(item.get("quoteVolume") or 0)
+                if times is not None:
+                    times[symbol] = int(item.get("closeTime") or 0)
+    return prices
+
+
+class BinanceUsdmFeed(FeedAdapter):
+    """Binance USDT-M perpetuals — основной рынок (OI и Funding грузятся для него)"""
+
+    name = "binance_usdm"
+    base_url = "https://fapi.binance.com"
+    ws_url = "wss://fstream.binance.com/stream"
+    streams = ("!ticker@arr", "!markPrice@arr")
+    ticker_path = "/fapi/v1/ticker/24hr"
+    ticker_weight = 40
+
+    @staticmethod
+    def is_tracked(symbol: str) -> bool:
+        """Отслеживаем только USDT-фьючерсы"""
+        return symbol.endswith("USDT") and not symbol.startswith("USDT_")
+
+    def parse_ticker(self, data) -> dict:
+        return _parse_binance_ticker(data, self.accepts, "lastPrice", self.volumes, self.times)
+
+    async def open_interest(self, symbol: str) -> float:
+        """Получение Open Interest для символа"""
+        try:
+            data = await self.client.get_json("/fapi/v1/openInterest", {"symbol": symbol})
+            return float(data.get("openInterest", 0))
+        except Exception as e:
+            print(f"⚠️ Ошибка OI для {symbol}: {e}")
+        return 0
+
+    async def funding_rates(self) -> dict:
+        """Funding Rate, mark price и время следующего funding — все монеты одним запросом"""
+        try:
+            data = await self.client.get_json("/fapi/v1/premiumIndex", weight=10)
+        except Exception as e:
+            print(f"⚠️ Ошибка получения Funding: {e}")
+            return {}
+
+        rates = {}
+        for item in data:
+            symbol = item.get("symbol")
+            if not symbol or not self.accepts(symbol):
+                continue
+            try:
+                rates[symbol] = {
+                    "rate": float(item.get("lastFundingRate") or 0) * 100,
+                    "time": int(item.get("time") or 0),
+                    "next_time": int(item.get("nextFundingTime") or 0),
+                    "mark_price": float(item.get("markPrice") or 0),
+                }
+            except (ValueError, TypeError):
+                continue
+        return rates
+
+
+class BinanceCoinmFeed(FeedAdapter):
+    """Binance COIN-M бессрочные контракты (BTCUSD_PERP и т.п.)"""
+
+    name = "binance_coinm"
+    prefix = "COINM:"
+    base_url = "https://dapi.binance.com"
+    ws_url = "wss://dstream.binance.com/stream"
+    streams = ("!ticker@arr",)
+    ticker_path = "/dapi/v1/ticker/24hr"
+    ticker_weight = 40
+
+    @staticmethod
+    def is_tracked(symbol: str) -> bool:
+        return symbol.endswith("_PERP")
+
+    def parse_ticker(self, data) -> dict:
+        return _parse_binance_ticker(data, self.accepts, "lastPrice", times=self.times)
+
+
+class BinanceSpotFeed(FeedAdapter):
+    """Binance спот, пары к USDT"""
+
+    name = "binance_spot"
+    prefix = "SPOT:"
+    base_url = "https://api.binance.com"
+    ws_url = "wss://stream.binance.com:9443/stream"
+    streams = ("!miniTicker@arr",)
+    ticker_path = "/api/v3/ticker/price"
+    ticker_weight = 4
+    weight_limit = 6000
+
+    @staticmethod
+    def is_tracked(symbol: str) -> bool:
+        return symbol.endswith("USDT")
+
+    def parse_ticker(self, data) -> dict:
+        return _parse_binance_ticker(data, self.accepts, "price")
+
+
+class BybitLinearFeed(FeedAdapter):
+    """Bybit USDT-перпетуалы. Потока всех тикеров у Bybit нет — опрос REST"""
+
+    name = "bybit_linear"
+    prefix = "BYBIT:"
+    base_url = "https://api.bybit.com"
+    ticker_path = "/v5/market/tickers?category=linear"
+    weight_limit = 600
+
+    @staticmethod
+    def is_tracked(symbol: str) -> bool:
+        return symbol.endswith("USDT")
+
+    def parse_ticker(self, data) -> dict:
+        items = (data.get("result") or {}).get("list") or []
+        return _parse_binance_ticker(items, self.accepts, "lastPrice")
+
+
+FEEDS = {feed.name: feed for feed in (BinanceUsdmFeed, BinanceCoinmFeed, BinanceSpotFeed, BybitLinearFeed)}
@@ -0,0 +1,172 @@
+import asyncio
+import heapq
+import time
+
+
+class MarketDataFetcher:
+    """Фоновая подгрузка Open Interest и Funding Rate.
+
+    OI опрашивается по символам через приоритетный планировщик (heap по времени
+    следующего опроса): активные монеты — чаще, неликвидные и с застывшим OI —
+    реже. Интервал символа зависит от движения цены (`activity`), объёма за 24ч
+    и того, менялся ли OI с прошлого опроса; суммарно запросов в минуту столько
+    же, сколько при опросе всех раз в `oi_interval`. Одновременно — не больше
+    `concurrency` запросов. Funding приходит одним bulk-запросом на все монеты.
+    Бюджет веса Binance соблюдает сам HTTP-клиент. Результаты пишутся в общие
+    словари `oi_values` / `funding_rates`, так что цикл цен никогда их не ждёт.
+    """
+
+    def __init__(self, fetch_oi, fetch_funding, concurrency: int = 10,
+                 oi_interval: float = 10, funding_interval: float = 60,
+                 oi_min_interval: float = 2, oi_max_interval: float = 60, activity=None):
+        self.fetch_oi = fetch_oi
+        self.fetch_funding = fetch_funding
+        self.concurrency = concurrency
+        self.oi_interval = oi_interval          # средний интервал — задаёт общий бюджет запросов
+        self.oi_min_interval = oi_min_interval
+        self.oi_max_interval = oi_max_interval
+        self.funding_interval = funding_interval
+        self.activity = activity    # callable(symbol) -> (движение цены %, объём за 24ч)
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        self.symbols = ()
+        self.oi_values = {}         # symbol -> последний OI
+        self.oi_updated = {}        # symbol -> время получения OI
+        self.oi_fresh = set()       # символы с OI, ещё не забранным детектором
+        self.oi_polls = 0
+        self.funding_rates = {}     # symbol -> {"rate", "time", "next_time", "mark_price"}
+        self.funding_live = None    # callable: True, если funding уже приходит из потока
+
+        self._heap = []             # (время следующего опроса, symbol)
+        self._scheduled = set()
+        self._weights = {}          # symbol -> желаемая частота (относительная)
+        self._weight_total = 0.0
+        self._unchanged = {}        # symbol -> опросов подряд без изменения OI
+        self._volume_ref = 0.0      # медианный объём — масштаб для объёмов монет
+        self._inflight = set()
+        self._tasks = []
+
+    def set_symbols(self, symbols):
+        """Символы для OI; коллекция может обновляться на месте (карта цен рынка)"""
+        self.symbols = symbols
+
+    def pop_oi_updates(self) -> set:
+        """Символы, по которым пришёл новый OI с прошлого вызова"""
+        fresh, self.oi_fresh = self.oi_fresh, set()
+        return fresh
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._schedule_oi()),
+                asyncio.create_task(self._loop(self._refresh_funding, self.funding_interval)),
+            ]
+
+    async def stop(self):
+        tasks = self._tasks + list(self._inflight)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _loop(self, refresh, interval: float):
+        while True:
+            started = time.time()
+            if self.symbols:
+                try:
+                    await refresh(list(self.symbols))
+                except Exception as e:
+                    print(f"⚠️ Ошибка фоновой загрузки: {e}")
+            await asyncio.sleep(max(0.5, interval - (time.time() - started)))
+
+    # ── Планировщик OI ──────────────────────────────────────────────────────
+    async def _schedule_oi(self):
+        heap = self._heap
+        last_sync = 0.0
+        while True:
+            now = time.time()
+            if now - last_sync >= 1:
+                self._sync_symbols(now)
+                last_sync = now
+            if not heap or heap[0][0] > now:
+                await asyncio.sleep(min(heap[0][0] - now, 1) if heap else 0.5)
+                continue
+
+            _, symbol = heapq.heappop(heap)
+            if symbol not in self.symbols:
+                self._forget(symbol)    # монета пропала из рынка
+                continue
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._poll_oi(symbol))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    def _sync_symbols(self, now: float):
+        """Новые символы — в расписание сразу, с небольшим разбросом"""
+        new = [s for s in self.symbols if s not in self._scheduled]
+        for i, symbol in enumerate(new):
+            self._scheduled.add(symbol)
+            self._set_weight(symbol, 1.0)
+            heapq.heappush(self._heap, (now + i * self.oi_interval / max(len(new), 1), symbol))
+        if new or not self._volume_ref:
+            self._update_volume_ref()
+
+    def _forget(self, symbol: str):
+        self._scheduled.discard(symbol)
+        self._weight_total -= self._weights.pop(symbol, 0.0)
+        self._unchanged.pop(symbol, None)
+
+    def _update_volume_ref(self):
+        if not self.activity:
+            return
+        volumes = sorted(self.activity(s)[1] for s in self._scheduled)
+        self._volume_ref = volumes[len(volumes) // 2] if volumes else 0.0
+
+    def _set_weight(self, symbol: str, weight: float):
+        self._weight_total += weight - self._weights.get(symbol, 0.0)
+        self._weights[symbol] = weight
+
+    def _next_interval(self, symbol: str, changed: bool) -> float:
+        """Интервал до следующего опроса символа в рамках общего бюджета"""
+        unchanged = 0 if changed else self._unchanged.get(symbol, 0) + 1
+        self._unchanged[symbol] = unchanged
+
+        weight = 1.0
+        if self.activity:
+            move, volume = self.activity(symbol)
+            weight *= 1 + min(abs(move), 5)                     # движение цены в %
+            if self._volume_ref > 0:
+                weight *= min(max((volume / self._volume_ref) ** 0.5, 0.25), 4)
+        weight /= 1 + min(unchanged, 6) * 0.5                   # OI застыл — реже
+        self._set_weight(symbol, weight)
+
+        # Частоты пропорциональны весам, сумма — как при опросе всех раз в oi_interval
+        budget = len(self._scheduled) / self.oi_interval        # запросов в секунду
+        interval = self._weight_total / (weight * budget) if budget and weight else self.oi_interval
+        return min(max(interval, self.oi_min_interval), self.oi_max_interval)
+
+    async def _poll_oi(self, symbol: str):
+        try:
+            value = await self.fetch_oi(symbol)
+        except Exception as e:
+            print(f"⚠️ Ошибка OI для {symbol}: {e}")
+            value = 0
+        finally:
+            self._semaphore.release()
+
+        now = time.time()
+        self.oi_polls += 1
+        changed = value > 0 and value != self.oi_values.get(symbol)
+        if value > 0:
+            self.oi_values[symbol] = value
+            self.oi_updated[symbol] = now
+            self.oi_fresh.add(symbol)
+        if self.oi_polls % 500 == 0:
+            self._update_volume_ref()
+        if symbol in self._scheduled:
+            heapq.heappush(self._heap, (now + self._next_interval(symbol, changed), symbol))
+
+    async def _refresh_funding(self, symbols: list):
+        if self.funding_live and self.funding_live():
+            return
+        self.funding_rates.update(await self.fetch_funding())
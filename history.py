@@ -0,0 +1,330 @@
+"""История цен, OI и Funding: колоночное хранилище на диске для /chart и /top.
+
+Раз в `resolution` секунд писатель (HistoryWriter, один на процесс трекинга)
+дописывает срез рынка в чанк текущих суток — по файлу на колонку, только
+append. Закрытые чанки уплотняются: строки сортируются по (символ, время), а
+чанки старше `coarse_after` прореживаются до `coarse_resolution`. Чанки старше
+`retention` удаляются. Читатель (HistoryReader) открывает колонки через mmap
+и отвечает на запросы без обращения к Binance; шарды пишут каждый в свой
+каталог, читатель сводит их вместе.
+
+    history/<писатель>/symbols.txt           # id символа = номер строки
+    history/<писатель>/<начало чанка>/ts.bin, symbol.bin, price.bin, ...
+"""
+import asyncio
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+COLUMNS = (
+    ("ts", "<u4"),          # время среза, секунды
+    ("symbol", "<u2"),      # id символа писателя
+    ("price", "<f8"),
+    ("oi", "<f8"),          # NaN — OI нет
+    ("funding", "<f4"),     # NaN — Funding нет
+)
+META = "meta.json"          # есть у уплотнённых чанков: {"resolution": ...}
+SPARK = "▁▂▃▄▅▆▇█"
+
+
+def parse_period(text: str) -> int:
+    """'15m', '4h', '1d' -> секунды"""
+    units = {"m": 60, "h": 3600, "d": 86400}
+    text = text.strip().lower()
+    if len(text) < 2 or text[-1] not in units or not text[:-1].isdigit() or int(text[:-1]) <= 0:
+        raise ValueError(f"неверный период: {text}")
+    return int(text[:-1]) * units[text[-1]]
+
+
+def sparkline(values, width: int = 30) -> str:
+    """Мини-график из блоков: последние значения на `width` участках"""
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return ""
+    if len(values) > width:
+        values = values[np.linspace(0, len(values) - 1, width).astype(int)]
+    low, high = values.min(), values.max()
+    if high <= low:
+        return SPARK[len(SPARK) // 2] * len(values)
+    levels = ((values - low) / (high - low) * (len(SPARK) - 1)).round().astype(int)
+    return "".join(SPARK[level] for level in levels)
+
+
+def _read_columns(path: str) -> dict:
+    """Колонки чанка через mmap; строк — по самой короткой колонке (запись могла оборваться)"""
+    rows = min(os.path.getsize(os.path.join(path, f"{name}.bin")) // np.dtype(dtype).itemsize
+               for name, dtype in COLUMNS)
+    if not rows:
+        return {name: np.empty(0, dtype) for name, dtype in COLUMNS}
+    return {name: np.memmap(os.path.join(path, f"{name}.bin"), dtype=dtype, mode="r", shape=(rows,))
+            for name, dtype in COLUMNS}
+
+
+def _chunks(path: str) -> list:
+    """(начало, каталог) чанков писателя по времени"""
+    if not os.path.isdir(path):
+        return []
+    return sorted((int(name), os.path.join(path, name)) for name in os.listdir(path) if name.isdigit())
+
+
+class HistoryWriter:
+    """Срезы рынка раз в `resolution` секунд, уплотнение и ротация чанков"""
+
+    def __init__(self, path: str = "history", name: str = "main", resolution: float = 60,
+                 chunk_seconds: int = 86400, retention: float = 30 * 86400,
+                 coarse_after: float = 7 * 86400, coarse_resolution: float = 900):
+        self.path = os.path.join(path, name)
+        self.resolution = resolution
+        self.chunk_seconds = chunk_seconds
+        self.retention = retention
+        self.coarse_after = coarse_after
+        self.coarse_resolution = coarse_resolution
+        self.rows = 0
+        self.ids = {}
+        self._task = None
+
+        os.makedirs(self.path, exist_ok=True)
+        self._symbols_file = os.path.join(self.path, "symbols.txt")
+        if os.path.exists(self._symbols_file):
+            with open(self._symbols_file, encoding="utf-8") as f:
+                self.ids = {symbol: i for i, symbol in enumerate(f.read().split())}
+
+    # ── Запись ──────────────────────────────────────────────────────────────
+    def frame(self, ts: float, prices: dict, oi_values: dict, funding_rates: dict) -> tuple:
+        """Срез рынка в колонки; собирается в event loop, пока словари не меняются"""
+        new = [symbol for symbol in prices if symbol not in self.ids]
+        for symbol in new:
+            self.ids[symbol] = len(self.ids)
+        nan = float("nan")
+        columns = {
+            "ts": np.full(len(prices), int(ts), "<u4"),
+            "symbol": np.fromiter((self.ids[s] for s in prices), "<u2", len(prices)),
+            "price": np.fromiter(prices.values(), "<f8", len(prices)),
+            "oi": np.fromiter((oi_values.get(s, nan) for s in prices), "<f8", len(prices)),
+            "funding": np.fromiter(
+                ((funding_rates[s]["rate"] if s in funding_rates else nan) for s in prices), "<f4", len(prices)
+            ),
+        }
+        return new, columns
+
+    def append(self, ts: float, new: list, columns: dict):
+        """Дописывает срез в чанк; новые символы — в словарь писателя (вызывается в потоке)"""
+        if new:
+            with open(self._symbols_file, "a", encoding="utf-8") as f:
+                f.write("".join(f"{symbol}\n" for symbol in new))
+        chunk = os.path.join(self.path, str(int(ts // self.chunk_seconds * self.chunk_seconds)))
+        os.makedirs(chunk, exist_ok=True)
+        for name, _ in COLUMNS:
+            with open(os.path.join(chunk, f"{name}.bin"), "ab") as f:
+                f.write(columns[name].tobytes())
+        self.rows += len(columns["ts"])
+
+    # ── Уплотнение и ротация ────────────────────────────────────────────────
+    def maintain(self, now: float = None):
+        """Удаляет чанки старше retention, уплотняет закрытые (вызывается в потоке)"""
+        now = now or time.time()
+        current = int(now // self.chunk_seconds * self.chunk_seconds)
+        for start, path in _chunks(self.path):
+            if start >= current:
+                continue
+            end = start + self.chunk_seconds
+            if end < now - self.retention:
+                shutil.rmtree(path)
+                continue
+            resolution = self.coarse_resolution if end < now - self.coarse_after else self.resolution
+            meta = self._meta(path)
+            if meta is None or meta["resolution"] < resolution:
+                self._compact(path, resolution)
+
+    @staticmethod
+    def _meta(path: str):
+        try:
+            with open(os.path.join(path, META)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _compact(self, path: str, resolution: float):
+        """Последняя точка на (символ, интервал), сортировка по символу; атомарная замена каталога"""
+        columns = _read_columns(path)
+        ts, symbol = columns["ts"], columns["symbol"]
+        bucket = ts // int(resolution)
+        order = np.lexsort((ts, bucket, symbol))
+        symbol_sorted, bucket_sorted = symbol[order], bucket[order]
+        last = np.r_[(symbol_sorted[1:] != symbol_sorted[:-1]) | (bucket_sorted[1:] != bucket_sorted[:-1]), True]
+        keep = order[last[:len(order)]]
+
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, _ in COLUMNS:
+            with open(os.path.join(tmp, f"{name}.bin"), "wb") as f:
+                f.write(np.ascontiguousarray(columns[name][keep]).tobytes())
+        with open(os.path.join(tmp, META), "w") as f:
+            json.dump({"resolution": resolution}, f)
+        del columns
+        old = f"{path}.old"
+        os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old)
+        print(f"🗜 История {os.path.basename(path)}: {len(ts)} → {len(keep)} строк (шаг {resolution:.0f}с)")
+
+    # ── Фоновая задача ──────────────────────────────────────────────────────
+    def start(self, snapshot):
+        """snapshot() -> (prices, oi_values, funding_rates)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(snapshot))
+        return self._task
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self, snapshot):
+        await asyncio.to_thread(self.maintain)
+        last_maintain = time.time()
+        while True:
+            # Срезы выровнены по сетке resolution — у всех шардов одни и те же ts
+            await asyncio.sleep(self.resolution - time.time() % self.resolution)
+            now = time.time()
+            try:
+                prices, oi_values, funding_rates = snapshot()
+                if prices:
+                    new, columns = self.frame(now, prices, oi_values, funding_rates)
+                    await asyncio.to_thread(self.append, now, new, columns)
+                if now - last_maintain >= 3600:
+                    await asyncio.to_thread(self.maintain, now)
+                    last_maintain = now
+            except Exception as e:
+                print(f"⚠️ Ошибка записи истории: {e}")
+
+
+class HistoryReader:
+    """Запросы к истории всех писателей каталога (процесс бота или шарды).
+
+    Открытые mmap чанков кэшируются (не больше `max_chunks`, вытесняются давно
+    не читанные); удалённые ротацией и заменённые уплотнением чанки
+    закрываются на следующем запросе, чтобы их место на диске освободилось.
+    """
+
+    def __init__(self, path: str = "history", max_chunks: int = 64):
+        self.path = path
+        self.max_chunks = max_chunks
+        self._symbols = {}      # писатель -> (размер symbols.txt, {symbol: id}, [symbol])
+        self._columns = {}      # каталог чанка -> ((inode, размер ts.bin), колонки, отсортирован ли); порядок — LRU
+
+    def _writers(self) -> list:
+        if not os.path.isdir(self.path):
+            return []
+        return [os.path.join(self.path, name) for name in sorted(os.listdir(self.path))
+                if os.path.isdir(os.path.join(self.path, name))]
+
+    def _symbol_table(self, writer: str) -> tuple:
+        path = os.path.join(writer, "symbols.txt")
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return {}, []
+        cached = self._symbols.get(writer)
+        if cached is None or cached[0] != size:
+            with open(path, encoding="utf-8") as f:
+                names = f.read().split()
+            cached = self._symbols[writer] = (size, {s: i for i, s in enumerate(names)}, names)
+        return cached[1], cached[2]
+
+    def _load(self, path: str) -> tuple:
+        """Колонки чанка и признак сортировки по символу; mmap переоткрывается, если чанк вырос"""
+        stat = os.stat(os.path.join(path, "ts.bin"))
+        cached = self._columns.pop(path, None)
+        if cached is None or cached[0] != (stat.st_ino, stat.st_size):
+            cached = ((stat.st_ino, stat.st_size), _read_columns(path), os.path.exists(os.path.join(path, META)))
+        self._columns[path] = cached        # в конец — недавно читанный
+        while len(self._columns) > self.max_chunks:
+            del self._columns[next(iter(self._columns))]
+        return cached[1], cached[2]
+
+    def _evict(self):
+        """Закрывает mmap чанков, которых больше нет на диске или которые заменило уплотнение"""
+        for path, (key, _, _) in list(self._columns.items()):
+            try:
+                stat = os.stat(os.path.join(path, "ts.bin"))
+            except FileNotFoundError:
+                del self._columns[path]
+                continue
+            if stat.st_ino != key[0]:
+                del self._columns[path]
+
+    def _ranges(self, start: float, end: float):
+        """(таблица символов, колонки, отсортирован ли) чанков, пересекающих [start, end]"""
+        self._evict()
+        for writer in self._writers():
+            ids, names = self._symbol_table(writer)
+            chunks = _chunks(writer)
+            for i, (chunk_start, path) in enumerate(chunks):
+                chunk_end = chunks[i + 1][0] if i + 1 < len(chunks) else float("inf")
+                if chunk_end <= start or chunk_start > end:
+                    continue
+                try:
+                    columns, is_sorted = self._load(path)
+                except FileNotFoundError:
+                    continue    # чанк удалён или заменяется уплотнением
+                yield ids, names, columns, is_sorted
+
+    def series(self, symbol: str, start: float, end: float = None) -> dict:
+        """Колонки ts/price/oi/funding символа за [start, end], по времени"""
+        end = end or time.time()
+        parts = []
+        for ids, _, columns, is_sorted in self._ranges(start, end):
+            i = ids.get(symbol)
+            if i is None:
+                continue
+            if is_sorted:
+                lo, hi = np.searchsorted(columns["symbol"], [i, i + 1])
+                rows = slice(lo, hi)
+            else:
+                rows = columns["symbol"] == i
+            ts = columns["ts"][rows]
+            inside = (ts >= start) & (ts <= end)
+            parts.append({name: columns[name][rows][inside] for name, _ in COLUMNS if name != "symbol"})
+        if not parts:
+            return {name: np.empty(0, dtype) for name, dtype in COLUMNS if name != "symbol"}
+        merged = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        order = np.argsort(merged["ts"], kind="stable")
+        return {name: values[order] for name, values in merged.items()}
+
+    def movers(self, window: float, now: float = None, limit: int = 10) -> list:
+        """[(symbol, изменение %, цена)] за последние `window` секунд, по убыванию |изменения|"""
+        now = now or time.time()
+        if limit <= 0:
+            return []
+        codes, ts, prices = [], [], []
+        index = {}              # имя -> общий код: id символов у писателей свои
+        for _, writer_names, columns, _ in self._ranges(now - window, now):
+            inside = (columns["ts"] >= now - window) & (columns["ts"] <= now)
+            lookup = np.fromiter((index.setdefault(name, len(index)) for name in writer_names), np.int64,
+                                 len(writer_names))
+            codes.append(lookup[columns["symbol"][inside]])
+            ts.append(columns["ts"][inside])
+            prices.append(columns["price"][inside])
+        names = list(index)
+        if not codes or not sum(len(c) for c in codes):
+            return []
+        codes, ts, prices = np.concatenate(codes), np.concatenate(ts), np.concatenate(prices)
+        order = np.lexsort((ts, codes))
+        codes, prices = codes[order], prices[order]
+        edges = np.flatnonzero(codes[1:] != codes[:-1])
+        first, last = np.r_[0, edges + 1], np.r_[edges, len(codes) - 1]
+        start_price, end_price = prices[first], prices[last]
+        valid = (start_price > 0) & (first != last)
+        change = np.zeros(len(first))
+        change[valid] = (end_price[valid] / start_price[valid] - 1) * 100
+        best = np.argsort(-np.abs(change))[:limit]
+        return [(names[codes[first[i]]], float(change[i]), float(end_price[i])) for i in best if valid[i]]
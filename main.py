@@ -1,16 +1,26 @@
-import aiohttp
 import asyncio
 import time
-import os
-import json
+PROCESS_STARTED = time.time()   # до тяжёлых импортов — от него считаются этапы запуска
+import numpy as np
 from aiogram import Router, Bot, Dispatcher, types
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, Message
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.filters import Command
-from collections import defaultdict
+from aiogram.filters import Command, CommandObject
 from env import TOKEN
-from aiohttp import ClientTimeout
 from datetime import datetime
+from ws_feed import FUTURES_WS_URL
+from binance_client import BinanceClient
+from delivery import AlertSender
+from alerts import AlertBatcher, AlertPublisher
+from tracker import Tracker
+from sharding import AlertHub, WorkerPool
+from checkpoint import StateCheckpoint
+from history import HistoryReader, parse_period, sparkline
+from rules import Rule
+from templates import format_number
+import metrics
+from subscriptions import SubscriptionManager, ALERT_KINDS
+from storage import SubscriberStore
 
 API_TOKEN = TOKEN
 
@@ -19,52 +29,102 @@ PRICE_CHANGE_THRESHOLD = 10     # % изменения цены (накопле
 INSTANT_PRICE_THRESHOLD = 3     # % для мгновенных алертов цены
 OI_CHANGE_THRESHOLD = 5         # % роста Open Interest (мгновенно)
 CHECK_INTERVAL = 0.5             # секунды между проверками
-TIMEFRAME = 15                  # минут — сброс накопления (только для цены)
-CHAT_IDS_FILE = "chat_ids.json"
+TIMEFRAME = 15                  # минут — основное окно накопленного изменения цены
+PRICE_WINDOWS = {               # минут окна: % реального изменения цены в окне
+    1: 5,
+    5: 7,
+    TIMEFRAME: PRICE_CHANGE_THRESHOLD,
+    60: 15,
+}
+DB_FILE = "subscribers.db"      # SQLite-хранилище подписчиков и их настроек
+CHAT_IDS_FILE = "chat_ids.json" # старый формат — переносится в базу при первом запуске
+SETTINGS_FILE = "user_settings.json"
+USE_WEBSOCKET = True            # цены из WebSocket-потока вместо опроса REST
+WS_URL = FUTURES_WS_URL         # можно указать локальный WS-стенд для тестов
+MARKETS = ("binance_usdm",)     # рынки: binance_usdm, binance_coinm, binance_spot, bybit_linear
+HTTP_TIMEOUT = 5                # секунды на любой REST-запрос к Binance
+HTTP_POOL_PER_HOST = 50         # максимум соединений к одному хосту
+FETCH_CONCURRENCY = 10          # параллельных запросов OI / Funding
+OI_INTERVAL = 10                # секунды между обновлениями OI (в среднем — активные монеты чаще)
+OI_MIN_INTERVAL = 2             # самый частый опрос OI одной монеты
+OI_MAX_INTERVAL = 60            # самый редкий опрос OI одной монеты
+FUNDING_INTERVAL = 60           # секунды между обновлениями Funding
+SEND_WORKERS = 8                # воркеров рассылки в Telegram
+SEND_RATE = 30                  # сообщений в секунду (глобальный лимит Telegram)
+SEND_CHAT_INTERVAL = 1.0        # секунды между сообщениями в один чат
+ALERT_BATCH_WINDOW = 0          # секунды склейки алертов (0 — один цикл трекинга)
+PRICE_ALERT_COOLDOWN = 60       # секунды между ценовыми алертами одного типа по монете
+MIN_THRESHOLDS = {              # наименьший порог /set, %: ниже детектор флагует весь рынок каждый тик
+    "instant": 0.1,
+    "price": 0.5,
+    "oi": 0.5,
+}
+MAX_USER_RULES = 5              # составных правил (/rule) на пользователя
+RECORD_FILE = None              # путь для записи рынка (replay / bench.py), None — не писать
+STATE_FILE = "detector.state"   # снимок состояния детекции для тёплого рестарта, None — без снимков
+STATE_INTERVAL = 30             # секунды между снимками состояния
+HISTORY_DIR = "history"         # история цен / OI / Funding для /chart и /top, None — не писать
+HISTORY_RESOLUTION = 60         # секунды между точками истории
+HISTORY_RETENTION_DAYS = 30     # дней хранить историю
+HISTORY_COARSE_DAYS = 7         # через сколько дней прореживать историю
+HISTORY_COARSE_RESOLUTION = 900 # секунды между точками прореженной истории
+METRICS_PORT = 9100             # локальный /metrics (Prometheus), None — выключен; шарды — +1+номер
+PROFILE_INTERVAL = None         # секунды между снимками профиля event loop, None — выключено
+PROFILE_DURATION = 10           # секунды одного снимка профиля
+SHARDS = 0                      # процессов-воркеров трекинга (0 — трекинг в процессе бота)
+SHARD_SOCKET = "alerts.sock"    # Unix-сокет, по которому воркеры шлют алерты
 # ===================================================
 
 router = Router()
 CHAT_IDS = set()
+# Подсистемы собирает create_app(): импорт модуля ничего не открывает и не создаёт
+store = subscriptions = bot = dp = client = sender = batcher = publisher = None
+hub = hub_checkpoint = workers = None
+tracking_task = None
 
 
-# ── Загрузка / сохранение списка chat_id ───────────────────────────────────
+# ── Загрузка / регистрация chat_id ─────────────────────────────────────────
 def load_chat_ids():
     global CHAT_IDS
-    if os.path.exists(CHAT_IDS_FILE):
-        try:
-            with open(CHAT_IDS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                CHAT_IDS = set(data)
-            print(f"[INIT] Загружено {len(CHAT_IDS)} пользователей")
-        except Exception as e:
-            print(f"Ошибка загрузки chat_ids.json: {e}")
-            CHAT_IDS = set()
-
-
-def save_chat_ids():
     try:
-        with open(CHAT_IDS_FILE, "w", encoding="utf-8") as f:
-            json.dump(list(CHAT_IDS), f, ensure_ascii=False, indent=2)
-        print(f"Сохранено {len(CHAT_IDS)} пользователей")
+        store.open()
+        store.migrate_json(CHAT_IDS_FILE, SETTINGS_FILE)
+        stored = store.load()
     except Exception as e:
-        print(f"Ошибка сохранения chat_ids.json: {e}")
+        print(f"Ошибка загрузки {DB_FILE}: {e}")
+        stored = {}
+    CHAT_IDS = set(stored)
+    subscriptions.load(stored)
+    print(f"[INIT] Загружено {len(CHAT_IDS)} пользователей")
 
 
 def register_chat_id(chat_id: int):
     if chat_id not in CHAT_IDS:
         CHAT_IDS.add(chat_id)
-        save_chat_ids()
+        subscriptions.register(chat_id)
         print(f"💾 Новый пользователь зарегистрирован: {chat_id}")
+        start_monitoring()      # первый подписчик на пустой установке
+
 
+def unregister_chat_id(chat_id: int):
+    if chat_id in CHAT_IDS:
+        CHAT_IDS.discard(chat_id)
+        subscriptions.remove(chat_id)
+        print(f"🗑 Пользователь удалён: {chat_id}")
 
-load_chat_ids()
 
+# ── Этапы запуска ──────────────────────────────────────────────────────────
+STARTUP_SECONDS = metrics.gauge("startup_seconds", "Секунды от старта процесса до этапа запуска")
+startup_stages = {}     # этап -> секунды от старта процесса
 
-# ── Инициализация бота ─────────────────────────────────────────────────────
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
-dp.include_router(router)
+
+def mark_startup(stage: str):
+    """app → startup → primed → prices → first_alert; каждый этап отмечается один раз"""
+    if stage in startup_stages:
+        return
+    seconds = startup_stages[stage] = time.time() - PROCESS_STARTED
+    STARTUP_SECONDS.set(round(seconds, 3), stage=stage)
+    print(f"⏱ Запуск: {stage} за {seconds:.2f}с")
 
 
 def create_reply_keyboard():
@@ -93,7 +153,7 @@ async def cmd_start(message: Message):
         f"👋 Привет, {message.from_user.first_name}!\n"
         "Я отслеживаю фьючерсы на **Binance**.\n"
         f"📊 Мгновенные алерты цены ≥ {INSTANT_PRICE_THRESHOLD}%\n"
-        f"📊 Накопленные алерты цены за {TIMEFRAME} мин ≥ {PRICE_CHANGE_THRESHOLD}%\n"
+        + "".join(f"📊 Изменение цены за {m} мин ≥ {t}%\n" for m, t in sorted(PRICE_WINDOWS.items())) +
         f"📈 Алерты OI при росте ≥ {OI_CHANGE_THRESHOLD}% (мгновенно)\n"
         "💰 Также показываю Funding Rate\n"
         "Поддержать проект: /donate"
@@ -112,355 +172,379 @@ async def donate_handler(message: Message):
     )
 
 
+async def is_registered(message: Message) -> bool:
+    """Настройки есть только у зарегистрированных чатов — без /start отвечаем подсказкой"""
+    if message.chat.id in CHAT_IDS:
+        return True
+    await message.answer("Сначала нажмите Start (/start) — после этого можно настраивать алерты",
+                         reply_markup=create_reply_keyboard())
+    return False
+
+
+KIND_NAMES = {"instant": "мгновенные", "price": "окна цены", "oi": "рост OI"}
+
+
+def render_settings(chat_id: int) -> str:
+    settings = subscriptions.get(chat_id)
+    thresholds = settings["thresholds"]
+    kinds = ", ".join(KIND_NAMES[k] for k in settings["kinds"]) or "—"
+    symbols = ", ".join(settings["symbols"]) or "все"
+    price = f"{thresholds['price']}%" if thresholds["price"] else "пороги окон"
+    return (
+        "⚙️ Настройки\n"
+        f"{'─' * 20}\n"
+        f"🔕 Уведомления: {'на паузе' if settings['muted'] else 'включены'}\n"
+        f"📊 Мгновенные ≥ {thresholds['instant']}%\n"
+        f"📊 Окна цены ≥ {price}\n"
+        f"📈 Рост OI ≥ {thresholds['oi']}%\n"
+        f"🔔 Алерты: {kinds}\n"
+        f"🪙 Монеты: {symbols}\n"
+        f"🧩 Правил: {len(settings['rules'])} (/rules)\n"
+        f"{'─' * 20}\n"
+        "/set instant|price|oi 5 — порог в % (/set price off — пороги окон)\n"
+        "/alerts instant|price|oi on|off — тип алертов\n"
+        "/watch BTCUSDT ETHUSDT — только эти монеты\n"
+        "/unwatch BTCUSDT | all — убрать монеты\n"
+        "/mute, /unmute — пауза уведомлений\n"
+        "/rule price 5m >= 3 and oi 15m >= 5 — своё правило\n"
+        "/chart BTCUSDT 4h — история монеты\n"
+        "/top 15m — сильнейшие движения"
+    )
+
+
+@router.message(Command("settings"))
 @router.message(lambda message: message.text == "Settings")
 async def settings_handler(message: Message):
-    await message.answer("⚙️ Настройки пока в разработке", reply_markup=create_reply_keyboard())
+    if not await is_registered(message):
+        return
+    await message.answer(render_settings(message.chat.id), reply_markup=create_reply_keyboard())
 
 
-# ── Binance API ────────────────────────────────────────────────────────────
-async def get_futures_prices():
-    """Получение цен фьючерсов - все монеты"""
-    url = "https://fapi.binance.com/fapi/v1/ticker/24hr"
-    timeout = ClientTimeout(total=5)
-    
+@router.message(Command("set"))
+async def set_threshold_handler(message: Message, command: CommandObject):
+    if not await is_registered(message):
+        return
+    args = (command.args or "").lower().split()
     try:
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as response:
-                if response.status == 429:
-                    retry_after = int(response.headers.get('Retry-After', 60))
-                    print(f"⚠️ Rate limit, ждем {retry_after}с")
-                    await asyncio.sleep(retry_after)
-                    return {}
-                
-                response.raise_for_status()
-                data = await response.json()
-                
-                prices = {}
-                for item in data:
-                    symbol = item.get("symbol")
-                    if symbol and symbol.endswith("USDT") and not symbol.startswith("USDT_"):
-                        try:
-                            price = float(item["lastPrice"])
-                            if price > 0:
-                                prices[symbol] = price
-                        except (ValueError, TypeError):
-                            continue
-                print(f"📊 Получено {len(prices)} монет")
-                return prices
-                
-    except Exception as e:
-        print(f"⚠️ Ошибка получения цен: {e}")
-        return {}
+        kind = args[0]
+        if kind == "price" and args[1] == "off":
+            value = 0       # доп. порога нет — только пороги окон
+        else:
+            value = float(args[1].replace(",", ".").rstrip("%"))
+            if kind not in ALERT_KINDS or not MIN_THRESHOLDS[kind] <= value < float("inf"):
+                raise ValueError
+    except (IndexError, KeyError, ValueError):
+        minimums = ", ".join(f"{k} ≥ {v}%" for k, v in MIN_THRESHOLDS.items())
+        await message.answer(f"Формат: /set instant|price|oi 5 ({minimums}), /set price off — только пороги окон")
+        return
+    subscriptions.update(message.chat.id, thresholds={kind: value})
+    await message.answer(render_settings(message.chat.id), reply_markup=create_reply_keyboard())
+
+
+@router.message(Command("alerts"))
+async def alerts_handler(message: Message, command: CommandObject):
+    if not await is_registered(message):
+        return
+    args = (command.args or "").lower().split()
+    if len(args) != 2 or args[0] not in ALERT_KINDS or args[1] not in ("on", "off"):
+        await message.answer("Формат: /alerts instant|price|oi on|off")
+        return
+    kinds = [k for k in subscriptions.get(message.chat.id)["kinds"] if k != args[0]]
+    if args[1] == "on":
+        kinds.append(args[0])
+    subscriptions.update(message.chat.id, kinds=kinds)
+    await message.answer(render_settings(message.chat.id), reply_markup=create_reply_keyboard())
+
+
+@router.message(Command("watch"))
+async def watch_handler(message: Message, command: CommandObject):
+    if not await is_registered(message):
+        return
+    new = [s.upper() for s in (command.args or "").replace(",", " ").split()]
+    if not new:
+        await message.answer("Формат: /watch BTCUSDT ETHUSDT")
+        return
+    symbols = subscriptions.get(message.chat.id)["symbols"]
+    subscriptions.update(message.chat.id, symbols=sorted(set(symbols) | set(new)))
+    await message.answer(render_settings(message.chat.id), reply_markup=create_reply_keyboard())
+
+
+@router.message(Command("unwatch"))
+async def unwatch_handler(message: Message, command: CommandObject):
+    if not await is_registered(message):
+        return
+    removed = {s.upper() for s in (command.args or "all").replace(",", " ").split()}
+    symbols = subscriptions.get(message.chat.id)["symbols"]
+    symbols = [] if "ALL" in removed else [s for s in symbols if s not in removed]
+    subscriptions.update(message.chat.id, symbols=symbols)
+    await message.answer(render_settings(message.chat.id), reply_markup=create_reply_keyboard())
+
+
+@router.message(Command("mute"))
+@router.message(Command("unmute"))
+async def mute_handler(message: Message, command: CommandObject):
+    if not await is_registered(message):
+        return
+    subscriptions.update(message.chat.id, muted=command.command == "mute")
+    await message.answer(render_settings(message.chat.id), reply_markup=create_reply_keyboard())
+
+
+# ── Составные правила ─────────────────────────────────────────────────────
+def render_rules(chat_id: int) -> str:
+    rules = subscriptions.get(chat_id)["rules"]
+    lines = [f"{i}. {rule}" for i, rule in enumerate(rules, 1)] or ["нет правил"]
+    return (
+        "🧩 Правила\n"
+        f"{'─' * 20}\n"
+        + "\n".join(lines) + "\n"
+        f"{'─' * 20}\n"
+        "/rule price 5m >= 3 and oi 15m >= 5 and funding < 0\n"
+        "/unrule 1 | all — удалить\n"
+        "Метрики: price <окно>, oi [окно], funding; and, or, not, скобки"
+    )
 
 
-async def get_open_interest(symbol: str) -> float:
-    """Получение Open Interest для символа"""
-    url = f"https://fapi.binance.com/fapi/v1/openInterest"
-    params = {"symbol": symbol}
-    
+@router.message(Command("rule"))
+async def rule_handler(message: Message, command: CommandObject):
+    if not await is_registered(message):
+        return
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return float(data.get("openInterest", 0))
-    except Exception as e:
-        print(f"⚠️ Ошибка OI для {symbol}: {e}")
-    
-    return 0
+        rule = Rule(command.args or "")
+    except ValueError as e:
+        await message.answer(f"⚠️ {e}\nФормат: /rule price 5m >= 3 and oi 15m >= 5")
+        return
+    rules = subscriptions.get(message.chat.id)["rules"]
+    if rule.text not in rules:
+        if len(rules) >= MAX_USER_RULES:
+            await message.answer(f"⚠️ Не больше {MAX_USER_RULES} правил, удалите лишнее: /unrule")
+            return
+        subscriptions.update(message.chat.id, rules=rules + [rule.text])
+    await message.answer(render_rules(message.chat.id))
+
+
+@router.message(Command("rules"))
+async def rules_handler(message: Message):
+    if not await is_registered(message):
+        return
+    await message.answer(render_rules(message.chat.id))
+
+
+@router.message(Command("unrule"))
+async def unrule_handler(message: Message, command: CommandObject):
+    if not await is_registered(message):
+        return
+    rules = subscriptions.get(message.chat.id)["rules"]
+    arg = (command.args or "").strip().lower()
+    if arg == "all":
+        rules = []
+    elif arg.isdigit() and 1 <= int(arg) <= len(rules):
+        rules = rules[:int(arg) - 1] + rules[int(arg):]
+    else:
+        await message.answer("Формат: /unrule 1 | all")
+        return
+    subscriptions.update(message.chat.id, rules=rules)
+    await message.answer(render_rules(message.chat.id))
 
 
-async def get_funding_rate(symbol: str) -> dict:
-    """Получение Funding Rate для символа"""
-    url = "https://fapi.binance.com/fapi/v1/fundingRate"
-    params = {
-        "symbol": symbol,
-        "limit": 1
-    }
-    
+# ── История ────────────────────────────────────────────────────────────────
+history = HistoryReader(HISTORY_DIR) if HISTORY_DIR else None
+
+
+def _change(values) -> str:
+    values = values[values > 0]
+    if len(values) < 2:
+        return ""
+    return f" ({(values[-1] / values[0] - 1) * 100:+.2f}%)"
+
+
+@router.message(Command("chart"))
+async def chart_handler(message: Message, command: CommandObject):
+    args = (command.args or "").split()
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data:
-                        return {
-                            "rate": float(data[0]["fundingRate"]) * 100,
-                            "time": data[0]["fundingTime"]
-                        }
-    except Exception:
-        pass
-    
-    return {"rate": 0, "time": 0}
-
-
-# ── Функции отправки уведомлений ───────────────────────────────────────────
-def format_number(num: float) -> str:
-    """Форматирование больших чисел"""
-    if num > 1_000_000_000:
-        return f"{num / 1_000_000_000:.2f}B"
-    elif num > 1_000_000:
-        return f"{num / 1_000_000:.2f}M"
-    elif num > 1_000:
-        return f"{num / 1_000:.2f}K"
-    else:
-        return f"{num:.0f}"
-
-
-async def send_price_alert(symbol: str, price_change: float, current_time: float, start_time: float, 
-                          funding: dict = None, oi: float = None, oi_change: float = None, alert_type: str = "НАКОПЛЕНО"):
-    """Отправка уведомления об изменении цены"""
-    emoji = "🟢" if price_change > 0 else "🔴"
-    
-    # Время
-    time_diff = max(0.1, current_time - start_time)
-    if time_diff < 20:
-        speed = "⚡ FAST"
-    elif time_diff < 60:
-        speed = "🏃 NORMAL"
-    else:
-        speed = "🐢 SLOW"
-    
-    time_str = f"{time_diff:.0f}s"
-    
-    # Funding Rate
-    funding_str = ""
-    if funding and funding["rate"] != 0:
-        funding_emoji = "📈" if funding["rate"] > 0 else "📉"
-        funding_str = f"{funding_emoji} Funding: {funding['rate']:.4f}%\n"
-    
-    # OI с процентом изменения
-    oi_str = ""
-    if oi and oi > 0:
-        oi_formatted = format_number(oi)
-        if oi_change is not None and abs(oi_change) >= 0.01:
-            oi_emoji = "📈" if oi_change > 0 else "📉"
-            oi_str = f"{oi_emoji} OI: {oi_change:+.2f}% ({oi_formatted})\n"
-        else:
-            oi_str = f"📊 OI: {oi_formatted}\n"
-    
-    # Тип алерта
-    type_icon = "⚡" if alert_type == "МГНОВЕННО" else "📈"
-    
-    # Сообщение
-    msg = (
-        f"🚨 {emoji} {symbol} {type_icon} {alert_type}\n"
+        symbol = args[0].upper()
+        label = (args[1] if len(args) > 1 else "1h").lower()
+        period = parse_period(label)
+    except (IndexError, ValueError):
+        await message.answer("Формат: /chart BTCUSDT 1h (m, h, d)")
+        return
+    if not history:
+        await message.answer("История выключена")
+        return
+
+    series = history.series(symbol, time.time() - period)
+    prices = series["price"]
+    if len(prices) < 2:
+        await message.answer(f"Нет истории по {symbol} за {label}")
+        return
+    oi = series["oi"][~np.isnan(series["oi"])]
+    funding = series["funding"][~np.isnan(series["funding"])]
+    first, last = (datetime.fromtimestamp(series["ts"][i]) for i in (0, -1))
+    text = (
+        f"📈 {symbol} за {label}\n"
         f"{'─' * 20}\n"
-        f"📊 Цена: {price_change:+.2f}%\n"
-        f"{oi_str}"
-        f"{funding_str}"
-        f"⚡ {speed} • {time_str} • ⌚ {TIMEFRAME} мин"
+        f"{sparkline(prices)}\n"
+        f"💲 Цена: {prices[-1]:g}{_change(prices)}\n"
+        f"⬆️ {prices.max():g}  ⬇️ {prices.min():g}\n"
     )
-    
-    await send_message_to_all(msg)
-    print(f"✅ {alert_type} Цена: {symbol} {price_change:+.2f}%")
-
-
-async def send_oi_alert(symbol: str, oi_change: float, current_time: float, 
-                       current_oi: float, funding: dict = None, price_change: float = None):
-    """Отправка уведомления о росте Open Interest (упрощенная версия)"""
-    # Время (просто для информации)
-    time_str = f"{CHECK_INTERVAL:.1f}с"
-    
-    # OI
-    oi_formatted = format_number(current_oi)
-    oi_emoji = "📈" if oi_change > 0 else "📉"
-    
-    # Funding Rate
-    funding_str = ""
-    if funding and funding["rate"] != 0:
-        funding_emoji = "📈" if funding["rate"] > 0 else "📉"
-        funding_str = f"{funding_emoji} Funding: {funding['rate']:.4f}%\n"
-    
-    # Цена с процентом
-    price_str = ""
-    if price_change and abs(price_change) >= 0.01:
-        price_emoji = "🟢" if price_change > 0 else "🔴"
-        price_str = f"{price_emoji} Цена: {price_change:+.2f}%\n"
-    
-    # Сообщение
-    msg = (
-        f"🚨 {symbol} {oi_emoji} OI РОСТ {oi_change:+.2f}%\n"
-        f"{'─' * 20}\n"
-        f"{oi_emoji} OI: {oi_formatted}\n"
-        f"{price_str}"
-        f"{funding_str}"
-        f"⚡ FAST • {time_str}"
+    if len(oi):
+        text += f"📊 OI: {format_number(oi[-1])}{_change(oi)}\n"
+    if len(funding):
+        text += f"💰 Funding: {funding[-1]:.4f}%\n"
+    text += f"🕒 {first:%d.%m %H:%M} — {last:%d.%m %H:%M}"
+    await message.answer(text)
+
+
+@router.message(Command("top"))
+async def top_handler(message: Message, command: CommandObject):
+    args = (command.args or "15m").split()
+    try:
+        period = parse_period(args[0])
+        limit = max(1, min(int(args[1]), 30)) if len(args) > 1 else 10
+    except ValueError:
+        await message.answer("Формат: /top 15m [10]")
+        return
+    if not history:
+        await message.answer("История выключена")
+        return
+
+    movers = history.movers(period, limit=limit)
+    if not movers:
+        await message.answer(f"Нет истории за {args[0]}")
+        return
+    lines = [f"{'🟢' if change > 0 else '🔴'} {symbol} {change:+.2f}% ({price:g})" for symbol, change, price in movers]
+    await message.answer(f"🏆 Топ движений за {args[0].lower()}\n{'─' * 20}\n" + "\n".join(lines))
+
+
+# ── Отправка уведомлений ───────────────────────────────────────────────────
+async def send_message_to_all(msg: str, chat_ids=None):
+    """Постановка сообщения в очередь рассылки (по умолчанию — всем пользователям)"""
+    sender.broadcast(msg, list(CHAT_IDS) if chat_ids is None else chat_ids)
+    mark_startup("first_alert")
+
+
+# ── Метрики ────────────────────────────────────────────────────────────────
+metrics.gauge("binance_used_weight", "Использованный вес запросов за минуту", lambda: client.used_weight)
+metrics.gauge("send_queue_depth", "Сообщений в очереди рассылки", lambda: sender.pending)
+metrics.gauge("subscribers", "Зарегистрированные пользователи", lambda: len(CHAT_IDS))
+metrics_server = metrics.MetricsServer(port=METRICS_PORT) if METRICS_PORT else None
+
+
+def tracker_settings() -> dict:
+    """Настройки трекинга — общие для процесса бота и воркеров-шардов"""
+    return {
+        "markets": list(MARKETS),
+        "use_websocket": USE_WEBSOCKET,
+        "ws_url": WS_URL,
+        "check_interval": CHECK_INTERVAL,
+        "windows": PRICE_WINDOWS,
+        "timeframe": TIMEFRAME,
+        "fetch_concurrency": FETCH_CONCURRENCY,
+        "oi_interval": OI_INTERVAL,
+        "oi_min_interval": OI_MIN_INTERVAL,
+        "oi_max_interval": OI_MAX_INTERVAL,
+        "funding_interval": FUNDING_INTERVAL,
+        "http_timeout": HTTP_TIMEOUT,
+        "record_file": RECORD_FILE,
+        "state_file": STATE_FILE,
+        "state_interval": STATE_INTERVAL,
+        "history": {
+            "path": HISTORY_DIR,
+            "resolution": HISTORY_RESOLUTION,
+            "retention": HISTORY_RETENTION_DAYS * 86400,
+            "coarse_after": HISTORY_COARSE_DAYS * 86400,
+            "coarse_resolution": HISTORY_COARSE_RESOLUTION,
+        } if HISTORY_DIR else None,
+    }
+
+
+def min_thresholds() -> dict:
+    return {kind: subscriptions.min_threshold(kind) for kind in ALERT_KINDS}
+
+
+# ── Сборка приложения ──────────────────────────────────────────────────────
+def create_app(token: str = API_TOKEN) -> Dispatcher:
+    """Собирает бота и подсистемы. Сеть, рассылка и трекинг стартуют позже:
+    в on_startup, а мониторинг — как только есть хотя бы один подписчик."""
+    global store, subscriptions, bot, dp, client, sender, batcher, publisher, hub, hub_checkpoint, workers
+    if dp is not None:
+        return dp
+
+    store = SubscriberStore(DB_FILE)
+    subscriptions = SubscriptionManager(store, {
+        "instant": INSTANT_PRICE_THRESHOLD,
+        "price": 0,                     # 0 — пороги окон PRICE_WINDOWS без доп. фильтра
+        "oi": OI_CHANGE_THRESHOLD,
+    })
+    load_chat_ids()
+
+    bot = Bot(token=token)
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(router)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+
+    client = BinanceClient(timeout=HTTP_TIMEOUT, limit_per_host=HTTP_POOL_PER_HOST)
+    sender = AlertSender(
+        bot, workers=SEND_WORKERS, global_rate=SEND_RATE,
+        per_chat_interval=SEND_CHAT_INTERVAL, on_chat_gone=unregister_chat_id
+    )
+    batcher = AlertBatcher(
+        send_message_to_all, subscriptions.match,
+        window=ALERT_BATCH_WINDOW, cooldown=PRICE_ALERT_COOLDOWN
     )
-    
-    await send_message_to_all(msg)
-    print(f"✅ OI РОСТ: {symbol} +{oi_change:+.2f}%")
+    publisher = AlertPublisher(batcher, CHECK_INTERVAL, TIMEFRAME)
 
+    if SHARDS:
+        hub = AlertHub(SHARD_SOCKET, batcher, min_thresholds, rules=subscriptions.rules,
+                       flush_interval=CHECK_INTERVAL)
+        # В режиме шардов детекция в воркерах, здесь остаются только кулдауны AlertBatcher
+        hub_checkpoint = StateCheckpoint(STATE_FILE, batcher=batcher, interval=STATE_INTERVAL) if STATE_FILE else None
+        workers = WorkerPool(SHARDS, SHARD_SOCKET, tracker_settings(), min_thresholds(), metrics_port=METRICS_PORT)
+    mark_startup("app")
+    return dp
 
-async def send_message_to_all(msg: str):
-    """Отправка сообщения всем зарегистрированным пользователям"""
-    for chat_id in list(CHAT_IDS):
-        try:
-            await bot.send_message(chat_id=chat_id, text=msg)
-            print(f"✅ Отправлено в {chat_id}")
-        except Exception as e:
-            print(f"❌ Ошибка отправки в {chat_id}: {e}")
-            if "chat not found" in str(e).lower() or "blocked" in str(e).lower():
-                CHAT_IDS.discard(chat_id)
-                save_chat_ids()
+
+def start_monitoring():
+    """Запускает трекинг один раз: при старте бота или с первым подписчиком"""
+    global tracking_task
+    if tracking_task is None:
+        print(f"✅ Пользователей: {len(CHAT_IDS)} → запускаем мониторинг")
+        tracking_task = asyncio.create_task(track_changes())
 
 
 async def track_changes():
     """Фоновая задача для отслеживания изменений"""
-    print("✅ Трекинг цен, OI и Funding запущен")
-    
-    # Хранилища данных
-    prices = {}           # Текущие цены
-    oi_values = {}        # Текущие OI
-    funding_rates = {}     # Текущие funding rates
-    
-    # Накопленные изменения (только для цены)
-    price_acc = defaultdict(float)      # Накопленное изменение цены
-    price_start = defaultdict(float)    # Время начала отслеживания цены
-    
-    # ПРОСТАЯ ЛОГИКА ДЛЯ OI
-    last_oi_values = {}    # Предыдущие значения OI
-    oi_alert_cooldown = {} # Время последнего алерта (чтобы не спамить)
-    
-    # Время последнего обновления
-    last_oi_update = defaultdict(float)
-    last_funding_update = defaultdict(float)
-    
-    # Для отслеживания предыдущих цен
-    last_prices = {}
-    
-    last_report = time.time()
-    request_count = 0
-    
-    while True:
-        try:
-            current_time = time.time()
-            
-            # Получаем цены
-            new_prices = await get_futures_prices()
-            request_count += 1
-            
-            if not new_prices:
-                await asyncio.sleep(CHECK_INTERVAL)
-                continue
-            
-            # Сброс устаревших накоплений цены
-            for symbol in list(price_start.keys()):
-                if current_time - price_start[symbol] >= TIMEFRAME * 60:
-                    price_acc[symbol] = 0
-                    price_start[symbol] = current_time
-            
-            # Анализируем каждый символ
-            for symbol, current_price in new_prices.items():
-                # Инициализация для новых символов
-                if symbol not in price_start:
-                    price_start[symbol] = current_time
-                    price_acc[symbol] = 0
-                
-                # ---- МГНОВЕННЫЙ АЛЕРТ ЦЕНЫ ----
-                if symbol in last_prices:
-                    last_price = last_prices[symbol]
-                    if last_price > 0:
-                        instant_change = ((current_price - last_price) / last_price) * 100
-                        if abs(instant_change) >= INSTANT_PRICE_THRESHOLD:
-                            await send_price_alert(
-                                symbol, 
-                                instant_change, 
-                                current_time, 
-                                current_time - CHECK_INTERVAL,
-                                funding_rates.get(symbol, {"rate": 0}),
-                                oi_values.get(symbol, 0),
-                                0,
-                                "МГНОВЕННО"
-                            )
-                
-                # ---- НАКОПЛЕННЫЙ АЛЕРТ ЦЕНЫ ----
-                if symbol in prices:
-                    last_price = prices[symbol]
-                    if last_price > 0:
-                        change = ((current_price - last_price) / last_price) * 100
-                        if abs(change) >= 0.01:
-                            price_acc[symbol] += change
-                            
-                            if abs(price_acc[symbol]) >= PRICE_CHANGE_THRESHOLD:
-                                await send_price_alert(
-                                    symbol, 
-                                    price_acc[symbol], 
-                                    current_time, 
-                                    price_start[symbol],
-                                    funding_rates.get(symbol, {"rate": 0}),
-                                    oi_values.get(symbol, 0),
-                                    0,
-                                    "НАКОПЛЕНО"
-                                )
-                                price_acc[symbol] = 0
-                                price_start[symbol] = current_time
-                
-                # ---- УПРОЩЕННАЯ ПРОВЕРКА OI (каждые 10 секунд) ----
-                if current_time - last_oi_update[symbol] >= 10:
-                    current_oi = await get_open_interest(symbol)
-                    last_oi_update[symbol] = current_time
-                    
-                    if current_oi > 0:
-                        # Сохраняем текущее OI
-                        oi_values[symbol] = current_oi
-                        
-                        # Проверяем рост от предыдущего значения
-                        if symbol in last_oi_values:
-                            last_oi = last_oi_values[symbol]
-                            if last_oi > 0:
-                                oi_growth = ((current_oi - last_oi) / last_oi) * 100
-                                
-                                # Если рост достиг порога и не спамим (кулдаун 5 минут)
-                                if (oi_growth >= OI_CHANGE_THRESHOLD and 
-                                    symbol not in oi_alert_cooldown or 
-                                    current_time - oi_alert_cooldown.get(symbol, 0) > 300):
-                                    
-                                    print(f"🔔 OI РОСТ {symbol}: {oi_growth:.2f}%")
-                                    await send_oi_alert(
-                                        symbol, 
-                                        oi_growth, 
-                                        current_time,
-                                        current_oi,
-                                        funding_rates.get(symbol, {"rate": 0}),
-                                        price_acc.get(symbol, 0)
-                                    )
-                                    oi_alert_cooldown[symbol] = current_time
-                        
-                        # Обновляем предыдущее значение
-                        last_oi_values[symbol] = current_oi
-                
-                # ---- Funding Rate ----
-                if current_time - last_funding_update[symbol] >= 60:
-                    funding_rates[symbol] = await get_funding_rate(symbol)
-                    last_funding_update[symbol] = current_time
-            
-            # Сохраняем текущие цены для следующего сравнения
-            last_prices = prices.copy()
-            
-            # Обновляем цены
-            prices = new_prices.copy()
-            
-            # Отчет
-            if current_time - last_report >= 30:
-                print(f"[{time.strftime('%H:%M:%S')}] Запросов: {request_count}, монет: {len(prices)}")
-                last_report = current_time
-                request_count = 0
-                
-        except Exception as e:
-            print(f"❌ Ошибка: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        await asyncio.sleep(CHECK_INTERVAL)
+    if workers:
+        # Трекинг в воркерах-шардах, сюда приходят только алерты
+        if hub_checkpoint:
+            hub_checkpoint.restore()
+            hub_checkpoint.start()
+        await hub.start()
+        workers.start()
+        return
+    tracker = Tracker(
+        publisher, batcher, subscriptions.min_threshold, client, rules=subscriptions.rules,
+        status=lambda: f"очередь: {sender.pending}", on_stage=mark_startup, **tracker_settings()
+    )
+    await tracker.run()
 
 
 async def on_startup():
     """Действия при запуске бота"""
     print("🚀 Бот запускается...")
+    mark_startup("startup")
+    await client.start()
+    sender.start()
+    if metrics_server:
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            print(f"⚠️ Метрики недоступны: {e}")
+    if PROFILE_INTERVAL:
+        asyncio.create_task(metrics.profile_periodically(PROFILE_INTERVAL, PROFILE_DURATION))
     if CHAT_IDS:
-        print(f"✅ Найдено {len(CHAT_IDS)} пользователей → запускаем мониторинг")
-        asyncio.create_task(track_changes())
+        # трекинг (и снимок рынка) стартует параллельно с подготовкой polling
+        start_monitoring()
     else:
         print("❌ Нет пользователей. Ждём /start")
 
@@ -468,16 +552,28 @@ async def on_startup():
 async def on_shutdown():
     """Действия при остановке бота"""
     print("👋 Бот останавливается...")
+    if tracking_task:
+        # трекер сохраняет последний снимок состояния при остановке
+        tracking_task.cancel()
+        await asyncio.gather(tracking_task, return_exceptions=True)
+    if metrics_server:
+        await metrics_server.stop()
+    if workers:
+        await workers.stop()
+        await hub.stop()
+        if hub_checkpoint:
+            await hub_checkpoint.stop()
+    await sender.stop()
+    await client.close()
+    await store.close()
     await bot.session.close()
 
 
 # ── Запуск бота ────────────────────────────────────────────────────────────
 async def main():
-    dp.startup.register(on_startup)
-    dp.shutdown.register(on_shutdown)
-    
     print("🚀 Запуск бота...")
-    await dp.start_polling(bot)
+    dispatcher = create_app()
+    await dispatcher.start_polling(bot)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,183 @@
+import asyncio
+import gzip
+import random
+import struct
+import time
+
+MAGIC = b"TRB1"
+
+# Типы кадров записи
+FRAME_SYMBOLS = 0       # новые символы: id -> имя
+FRAME_PRICES = 1        # изменившиеся цены
+FRAME_OI = 2            # свежие значения OI
+FRAME_FUNDING = 3       # funding rate и время следующего начисления
+
+_HEADER = struct.Struct("<BdI")         # тип, время, число записей
+_SYMBOL = struct.Struct("<HB")          # id, длина имени
+_VALUE = struct.Struct("<Hd")           # id, значение
+_FUNDING = struct.Struct("<Hdq")        # id, rate, next_time
+
+
+class MarketRecorder:
+    """Запись снапшотов рынка в компактный бинарный файл (gzip).
+
+    Цены пишутся дельтами — только изменившиеся с прошлого кадра; символы
+    кодируются двухбайтовыми id.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ids = {}
+        self.frames = 0
+        self._last_prices = {}
+        self._file = gzip.open(path, "wb", compresslevel=6)
+        self._file.write(MAGIC)
+
+    def _ids_for(self, ts: float, symbols) -> list:
+        new = [s for s in symbols if s not in self.ids]
+        if new:
+            chunks = [_HEADER.pack(FRAME_SYMBOLS, ts, len(new))]
+            for symbol in new:
+                self.ids[symbol] = len(self.ids)
+                name = symbol.encode()
+                chunks.append(_SYMBOL.pack(self.ids[symbol], len(name)) + name)
+            self._file.write(b"".join(chunks))
+        return [self.ids[s] for s in symbols]
+
+    def _write_values(self, kind: int, ts: float, values: dict):
+        if not values:
+            return
+        ids = self._ids_for(ts, values)
+        chunks = [_HEADER.pack(kind, ts, len(values))]
+        chunks.extend(_VALUE.pack(i, v) for i, v in zip(ids, values.values()))
+        self._file.write(b"".join(chunks))
+        self.frames += 1
+
+    def record_prices(self, ts: float, prices: dict):
+        last = self._last_prices
+        changed = {s: p for s, p in prices.items() if last.get(s) != p}
+        last.update(changed)
+        self._write_values(FRAME_PRICES, ts, changed)
+
+    def record_oi(self, ts: float, oi_values: dict):
+        self._write_values(FRAME_OI, ts, oi_values)
+
+    def record_funding(self, ts: float, funding_rates: dict):
+        if not funding_rates:
+            return
+        ids = self._ids_for(ts, funding_rates)
+        chunks = [_HEADER.pack(FRAME_FUNDING, ts, len(funding_rates))]
+        chunks.extend(
+            _FUNDING.pack(i, f["rate"], f.get("next_time", 0))
+            for i, f in zip(ids, funding_rates.values())
+        )
+        self._file.write(b"".join(chunks))
+        self.frames += 1
+
+    def close(self):
+        self._file.close()
+
+
+def read_recording(path: str):
+    """Кадры записи: (тип, время, {symbol: значение}).
+
+    Запись, оборванная остановкой процесса, читается до последнего целого кадра.
+    """
+    try:
+        yield from _read_frames(path)
+    except (EOFError, struct.error):
+        return
+
+
+def _read_frames(path: str):
+    names = {}
+    with gzip.open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: не запись рынка")
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            kind, ts, count = _HEADER.unpack(header)
+            if kind == FRAME_SYMBOLS:
+                for _ in range(count):
+                    symbol_id, length = _SYMBOL.unpack(f.read(_SYMBOL.size))
+                    names[symbol_id] = f.read(length).decode()
+                continue
+            if kind == FRAME_FUNDING:
+                data = f.read(_FUNDING.size * count)
+                yield kind, ts, {
+                    names[i]: {"rate": rate, "time": int(ts * 1000), "next_time": next_time}
+                    for i, rate, next_time in _FUNDING.iter_unpack(data)
+                }
+                continue
+            data = f.read(_VALUE.size * count)
+            yield kind, ts, {names[i]: value for i, value in _VALUE.iter_unpack(data)}
+
+
+def synthetic_frames(symbols: int = 300, ticks: int = 3000, tick: float = 1.0,
+                     oi_every: int = 10, seed: int = 1):
+    """Синтетический рынок для бенчмарка без записи: случайное блуждание
+    со скачками и общими для рынка движениями"""
+    rng = random.Random(seed)
+    names = [f"C{i:03d}USDT" for i in range(symbols)]
+    prices = {name: rng.uniform(0.01, 50_000) for name in names}
+    oi = {name: rng.uniform(1e5, 1e9) for name in names}
+    ts = 1_700_000_000.0
+
+    yield FRAME_FUNDING, ts, {n: {"rate": 0.01, "time": int(ts * 1000), "next_time": 0} for n in names}
+    for step in range(ticks):
+        ts += tick
+        market = rng.gauss(0, 0.03) if step % 500 else rng.choice((-1, 1)) * rng.uniform(3, 8)
+        changed = {}
+        for name in names:
+            if rng.random() < 0.6:
+                move = rng.gauss(0, 0.05) + market
+                if rng.random() < 0.001:
+                    move += rng.choice((-1, 1)) * rng.uniform(3, 12)
+                prices[name] *= 1 + move / 100
+                changed[name] = prices[name]
+        yield FRAME_PRICES, ts, changed
+        if step % oi_every == 0:
+            for name in names:
+                oi[name] *= 1 + rng.gauss(0, 0.5 if rng.random() > 0.002 else 8) / 100
+            yield FRAME_OI, ts, dict(oi)
+
+
+async def replay(frames, detector, after_tick=None, speed: float = 0):
+    """Прогоняет кадры через Detector.
+
+    speed — во сколько раз быстрее реального времени (0 — без пауз);
+    after_tick(ts, detect_seconds) вызывается после каждого кадра цен.
+    """
+    prices = {}
+    last_ts = None
+    for kind, ts, values in frames:
+        if speed and last_ts is not None and ts > last_ts:
+            await asyncio.sleep((ts - last_ts) / speed)
+        last_ts = ts
+
+        if kind == FRAME_PRICES:
+            prices.update(values)
+            started = time.perf_counter()
+            await detector.process_prices(prices, ts)
+            if after_tick:
+                await after_tick(ts, time.perf_counter() - started)
+        elif kind == FRAME_OI:
+            detector.oi_values.update(values)
+            await detector.process_oi(list(values), ts)
+        elif kind == FRAME_FUNDING:
+            detector.funding_rates.update(values)
+
+
+class FakeBot:
+    """Заглушка aiogram.Bot: запоминает сообщения вместо отправки"""
+
+    def __init__(self, on_send=None):
+        self.on_send = on_send      # callable(chat_id, text)
+        self.sent = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.sent += 1
+        if self.on_send:
+            self.on_send(chat_id, text)
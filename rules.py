@@ -0,0 +1,236 @@
+"""Составные правила алертов: "price 5m >= 3 and oi 15m >= 5 and funding < 0".
+
+Метрики:
+    price <окно>    — движение цены в скользящем окне, %
+    oi [<окно>]     — изменение OI за окно, % (без окна — с прошлого опроса)
+    funding         — текущий Funding Rate, %
+
+Сравнения >=, <=, >, < (и ≥, ≤), связки and / or / not, скобки. Логика
+трёхзначная: сравнение с неизвестной метрикой (нет Funding, нет истории окна)
+даёт «неизвестно», и `not` его не переворачивает — правило срабатывает только
+при известном «истинно». Правила всех пользователей компилируются в один план (RulePlan): каждая
+метрика и каждое сравнение считаются один раз за тик для всех правил сразу.
+"""
+import operator
+import re
+
+import numpy as np
+
+from history import parse_period
+
+MAX_RULE_LENGTH = 200       # каноническая запись правила — ключ кулдауна в снимке состояния
+MAX_RULE_INPUT = 400        # длина текста правила до разбора
+MAX_RULE_DEPTH = 10         # вложенность скобок и not — разбор рекурсивный
+
+OPERATORS = {">=": operator.ge, "<=": operator.le, ">": operator.gt, "<": operator.lt}
+_TOKEN = re.compile(r"\s*(>=|<=|≥|≤|>|<|\(|\)|\d+[mhdMHD]\b|-?\d+(?:\.\d+)?%?|[A-Za-z_]+)")
+
+
+def _tokens(text: str) -> list:
+    tokens, position = [], 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match:
+            raise ValueError(f"непонятно: {text[position:position + 10]}")
+        tokens.append(match.group(1).lower().replace("≥", ">=").replace("≤", "<="))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens = _tokens(text)
+        self.position = 0
+        self.depth = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected: str = None) -> str:
+        token = self.peek()
+        if token is None or (expected and token != expected):
+            raise ValueError(f"ожидалось {expected or 'продолжение'}, получено {token or 'конец правила'}")
+        self.position += 1
+        return token
+
+    def parse(self) -> tuple:
+        node = self.expression()
+        if self.peek() is not None:
+            raise ValueError(f"лишнее: {self.peek()}")
+        return node
+
+    def expression(self) -> tuple:
+        node = self.conjunction()
+        while self.peek() == "or":
+            self.take()
+            node = ("or", node, self.conjunction())
+        return node
+
+    def conjunction(self) -> tuple:
+        node = self.negation()
+        while self.peek() == "and":
+            self.take()
+            node = ("and", node, self.negation())
+        return node
+
+    def negation(self) -> tuple:
+        if self.peek() not in ("not", "("):
+            return self.comparison()
+        self.depth += 1
+        if self.depth > MAX_RULE_DEPTH:
+            raise ValueError(f"вложенность больше {MAX_RULE_DEPTH}")
+        if self.take() == "not":
+            node = ("not", self.negation())
+        else:
+            node = self.expression()
+            self.take(")")
+        self.depth -= 1
+        return node
+
+    def comparison(self) -> tuple:
+        metric = self.metric()
+        op = self.take()
+        if op not in OPERATORS:
+            raise ValueError(f"ожидалось сравнение (>=, <=, >, <), получено {op}")
+        try:
+            value = float(self.take().rstrip("%"))
+        except ValueError:
+            raise ValueError("после сравнения нужно число") from None
+        return ("cmp", metric, op, value)
+
+    def metric(self) -> tuple:
+        name = self.take()
+        if name == "price":
+            return ("price", self.period(required=True))
+        if name == "oi":
+            return ("oi", self.period(required=False))
+        if name == "funding":
+            return ("funding", 0)
+        raise ValueError(f"неизвестная метрика: {name} (price, oi, funding)")
+
+    def period(self, required: bool) -> int:
+        token = self.peek()
+        if token and token[-1] in "mhd" and token[:-1].isdigit():
+            self.take()
+            return parse_period(token)
+        if required:
+            raise ValueError("у price нужно окно: price 5m")
+        return 0
+
+
+def metric_name(metric: tuple) -> str:
+    kind, window = metric
+    if not window:
+        return kind
+    for unit, seconds in (("d", 86400), ("h", 3600), ("m", 60)):
+        if window % seconds == 0:
+            return f"{kind} {window // seconds}{unit}"
+    return f"{kind} {window}s"
+
+
+def _format(node: tuple, parent: str = None) -> str:
+    if node[0] == "cmp":
+        _, metric, op, value = node
+        return f"{metric_name(metric)} {op} {value:g}"
+    if node[0] == "not":
+        return f"not {_format(node[1], 'not')}"
+    text = f"{_format(node[1], node[0])} {node[0]} {_format(node[2], node[0])}"
+    # скобки только там, где без них смысл поменяется
+    return f"({text})" if parent and parent != node[0] else text
+
+
+class Rule:
+    """Разобранное правило; `text` — каноническая запись (одинаковые правила совпадают)"""
+
+    def __init__(self, text: str):
+        if len(text) > MAX_RULE_INPUT:
+            raise ValueError(f"правило длиннее {MAX_RULE_INPUT} символов")
+        self.tree = _Parser(text).parse()
+        self.text = _format(self.tree)
+        if len(self.text) > MAX_RULE_LENGTH:
+            raise ValueError(f"правило длиннее {MAX_RULE_LENGTH} символов")
+
+    def metrics(self) -> list:
+        """Метрики правила в порядке появления, без повторов"""
+        found = []
+
+        def walk(node):
+            if node[0] == "cmp":
+                if node[1] not in found:
+                    found.append(node[1])
+            else:
+                for child in node[1:]:
+                    walk(child)
+
+        walk(self.tree)
+        return found
+
+
+class RulePlan:
+    """Общий план вычисления правил.
+
+    Метрики и сравнения всех правил собираются без повторов: на тик строится
+    матрица метрик (символы × метрики), из неё — матрицы сравнений и их
+    известности, а каждое правило — это уже готовая функция от их колонок.
+    """
+
+    def __init__(self, rules: list):
+        self.rules = []             # [(Rule, evaluate(P, K) -> (истинно, известно), индексы своих метрик)]
+        self.metrics = []           # [(kind, window)]
+        self.predicates = []        # [(индекс метрики, оператор, значение)]
+        metric_index, predicate_index = {}, {}
+
+        def compile_node(node):
+            if node[0] == "cmp":
+                _, metric, op, value = node
+                if metric not in metric_index:
+                    metric_index[metric] = len(self.metrics)
+                    self.metrics.append(metric)
+                key = (metric_index[metric], op, value)
+                if key not in predicate_index:
+                    predicate_index[key] = len(self.predicates)
+                    self.predicates.append(key)
+                column = predicate_index[key]
+                return lambda P, K: (P[:, column], K[:, column])
+            if node[0] == "not":
+                inner = compile_node(node[1])
+                return lambda P, K: _negate(*inner(P, K))
+            left, right = compile_node(node[1]), compile_node(node[2])
+            if node[0] == "and":
+                return lambda P, K: _both(*left(P, K), *right(P, K))
+            return lambda P, K: _either(*left(P, K), *right(P, K))
+
+        for rule in rules:
+            evaluate = compile_node(rule.tree)
+            self.rules.append((rule, evaluate, [metric_index[m] for m in rule.metrics()]))
+
+    def windows(self, kind: str) -> set:
+        return {window for metric_kind, window in self.metrics if metric_kind == kind and window}
+
+    def evaluate(self, values: np.ndarray) -> list:
+        """values — (символы × метрики), NaN — метрики нет. Возвращает bool-массив на правило:
+        True — правило известно и истинно"""
+        P = np.empty((len(values), len(self.predicates)), dtype=bool)
+        K = np.empty_like(P)
+        known = ~np.isnan(values)
+        with np.errstate(invalid="ignore"):
+            for column, (metric, op, value) in enumerate(self.predicates):
+                P[:, column] = OPERATORS[op](values[:, metric], value)
+                K[:, column] = known[:, metric]
+        return [evaluate(P, K)[0] for _, evaluate, _ in self.rules]
+
+
+# Логика Клини: (истинно, известно); «истинно» всегда влечёт «известно»
+def _negate(value, known):
+    return known & ~value, known
+
+
+def _both(a, known_a, b, known_b):
+    # известно, если известны оба или хоть один известно ложен
+    return a & b, (known_a & known_b) | (known_a & ~a) | (known_b & ~b)
+
+
+def _either(a, known_a, b, known_b):
+    # известно, если известны оба или хоть один истинен
+    return a | b, (known_a & known_b) | a | b
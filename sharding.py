@@ -0,0 +1,324 @@
+"""Шардирование: трекинг в процессах-воркерах, рассылка — в процессе бота.
+
+Каждый воркер отслеживает свою часть монет (crc32(symbol) % shards) и шлёт
+алерты цикла пачкой по Unix-сокету; процесс бота принимает их в AlertHub,
+склеивает в AlertBatcher и рассылает. Обратно воркерам уходят минимальные
+пороги и составные правила подписчиков, чтобы детектор не срабатывал впустую.
+Метрики воркера — на своём порту (--metrics-port, у WorkerPool — базовый
+порт + 1 + номер шарда), процесс бота их не собирает.
+
+Ограничение: поделена детекция, OI/Funding и REST, но не приём потока. Каждый
+шард подписан на общие !ticker@arr / !markPrice@arr и разбирает JSON каждого
+кадра целиком, а чужие монеты отбрасывает уже после разбора — стоимость
+приёма повторяется в каждом шарде.
+
+    python sharding.py --shard 0 --shards 4 --socket alerts.sock   # воркер вручную
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+import zlib
+
+import metrics
+from alerts import AlertPublisher
+from binance_client import BinanceClient
+from tracker import Tracker
+
+
+def shard_of(symbol: str, shards: int) -> int:
+    """Номер шарда монеты — одинаковый во всех процессах (в отличие от hash())"""
+    return zlib.crc32(symbol.encode()) % shards
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False).encode() + b"\n"
+
+
+class AlertChannel:
+    """Сторона воркера: замена AlertBatcher, алерты цикла уходят пачкой в процесс бота.
+
+    Кулдауны, склейку и рендер сообщений делает AlertBatcher на той стороне.
+    Пока соединения нет, алерты отбрасываются (dropped) — воркер не копит их
+    в памяти.
+    """
+
+    def __init__(self, path: str, thresholds: dict, max_backoff: float = 10):
+        self.path = path
+        self.thresholds = dict(thresholds)  # kind -> минимальный порог подписчиков
+        self.rules = ()                     # составные правила подписчиков
+        self.ready = asyncio.Event()        # пришли первые пороги и правила
+        self.max_backoff = max_backoff
+        self.pending = []
+        self.sent = 0
+        self.dropped = 0
+        self._writer = None
+        self._task = None
+
+    def min_threshold(self, kind: str) -> float:
+        return self.thresholds[kind]
+
+    def current_rules(self) -> tuple:
+        return self.rules
+
+    def add(self, kind: str, topic: str, group: str, symbol: str, value: float, event,
+            now: float = None, cooldown: float = None) -> bool:
+        self.pending.append([kind, topic, group, symbol, value, event, now, cooldown])
+        return True
+
+    async def flush(self, now: float = None):
+        if not self.pending:
+            return
+        alerts, self.pending = self.pending, []
+        if self._writer is None:
+            self.dropped += len(alerts)
+            return
+        try:
+            self._writer.write(_encode({"ts": now, "alerts": alerts}))
+            await self._writer.drain()
+            self.sent += len(alerts)
+        except ConnectionError:
+            self.dropped += len(alerts)
+            self._writer = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        backoff = 0.5
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                print(f"⚠️ Нет связи с процессом рассылки ({self.path}): {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = 0.5
+            self._writer = writer
+            print(f"🔌 Подключен к процессу рассылки: {self.path}")
+            try:
+                while line := await reader.readline():
+                    message = json.loads(line)
+                    if "thresholds" in message:
+                        self.thresholds.update(message["thresholds"])
+                    if "rules" in message:
+                        self.rules = tuple(message["rules"])
+                    self.ready.set()
+            except ConnectionError:
+                pass
+            finally:
+                self._writer = None
+                writer.close()
+            print("🔄 Процесс рассылки отключился, переподключение")
+
+
+class AlertHub:
+    """Сторона процесса бота: принимает пачки алертов воркеров и отдаёт их в AlertBatcher.
+
+    Рассылка — по своему таймеру раз в `flush_interval` (цикл трекинга), а не
+    на каждую пачку: алерты всех шардов за цикл уходят чату одним дайджестом.
+    """
+
+    def __init__(self, path: str, batcher, thresholds, push_interval: float = 1.0, rules=None,
+                 flush_interval: float = 0.5):
+        self.path = path
+        self.batcher = batcher
+        self.thresholds = thresholds        # callable() -> {kind: минимальный порог}
+        self.rules = rules                  # callable() -> составные правила подписчиков
+        self.push_interval = push_interval
+        self.flush_interval = flush_interval
+        self.received = 0
+        self._writers = set()
+        self._current = {}
+        self._server = None
+        self._tasks = []
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)    # сокет от прошлого запуска
+        self._server = await asyncio.start_unix_server(self._handle, self.path)
+        self._tasks = [asyncio.create_task(self._push_thresholds()), asyncio.create_task(self._flush())]
+        print(f"📡 Приём алертов от воркеров: {self.path}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._server:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            self._current = self._settings()
+            writer.write(_encode(self._current))
+            while line := await reader.readline():
+                batch = json.loads(line)
+                for alert in batch["alerts"]:
+                    self.batcher.add(*alert)
+                self.received += len(batch["alerts"])
+        except (ConnectionError, ValueError) as e:
+            print(f"⚠️ Ошибка канала воркера: {e}")
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.batcher.flush(time.time())
+            except Exception as e:
+                print(f"⚠️ Ошибка рассылки алертов воркеров: {e}")
+
+    def _settings(self) -> dict:
+        return {"thresholds": self.thresholds(), "rules": list(self.rules()) if self.rules else []}
+
+    async def _push_thresholds(self):
+        """Пороги и правила подписчиков меняются командами — рассылаем воркерам изменения"""
+        while True:
+            await asyncio.sleep(self.push_interval)
+            settings = self._settings()
+            if settings == self._current:
+                continue
+            self._current = settings
+            for writer in list(self._writers):
+                try:
+                    writer.write(_encode(settings))
+                except ConnectionError:
+                    self._writers.discard(writer)
+
+
+class WorkerPool:
+    """Запускает воркеры-шарды отдельными процессами и перезапускает упавшие"""
+
+    def __init__(self, shards: int, path: str, settings: dict, thresholds: dict, restart_delay: float = 5,
+                 metrics_port: int = None):
+        self.shards = shards
+        self.path = path
+        self.settings = settings            # аргументы Tracker (JSON-совместимые)
+        self.thresholds = thresholds
+        self.metrics_port = metrics_port    # порт /metrics процесса бота; шард — metrics_port + 1 + номер
+        self.restart_delay = restart_delay
+        self.processes = {}
+        self._tasks = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._supervise(shard)) for shard in range(self.shards)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _supervise(self, shard: int):
+        args = [
+            sys.executable, os.path.abspath(__file__),
+            "--shard", str(shard), "--shards", str(self.shards), "--socket", self.path,
+            "--settings", json.dumps(self.settings), "--thresholds", json.dumps(self.thresholds),
+        ]
+        if self.metrics_port:
+            args += ["--metrics-port", str(self.metrics_port + 1 + shard)]
+        while True:
+            process = self.processes[shard] = await asyncio.create_subprocess_exec(*args)
+            print(f"⚙️ Воркер {shard}/{self.shards} запущен (pid {process.pid})")
+            try:
+                code = await process.wait()
+            except asyncio.CancelledError:
+                if process.returncode is None:
+                    process.terminate()
+                    await process.wait()
+                raise
+            print(f"⚠️ Воркер {shard} завершился с кодом {code}, перезапуск через {self.restart_delay}с")
+            await asyncio.sleep(self.restart_delay)
+
+
+async def run_worker(shard: int, shards: int, path: str, settings: dict, thresholds: dict,
+                     metrics_port: int = None):
+    # SIGTERM от WorkerPool — штатная остановка с последним снимком состояния
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    metrics_server = metrics.MetricsServer(port=metrics_port) if metrics_port else None
+    if metrics_server:
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            print(f"⚠️ Метрики шарда недоступны: {e}")
+            metrics_server = None
+    channel = AlertChannel(path, thresholds)
+    channel.start()
+    # правила нужны до загрузки снимка состояния (окна правил), но без процесса рассылки не ждём вечно
+    try:
+        await asyncio.wait_for(channel.ready.wait(), 10)
+    except asyncio.TimeoutError:
+        print("⚠️ Правила подписчиков не получены, старт без них")
+    publisher = AlertPublisher(channel, settings.get("check_interval", 0.5), settings.get("timeframe", 15))
+    client = BinanceClient(timeout=settings.get("http_timeout", 5), weight_limit=2400 // shards)
+    metrics.gauge("binance_used_weight", "Использованный вес запросов за минуту", lambda: client.used_weight)
+    # Файлы записи рынка, снимков состояния и история — свои у каждого шарда
+    for key in ("record_file", "state_file"):
+        if settings.get(key):
+            settings = {**settings, key: f"{settings[key]}.{shard}"}
+    if settings.get("history"):
+        settings = {**settings, "history": {**settings["history"], "name": f"shard{shard}"}}
+    tracker = Tracker(
+        publisher, channel, channel.min_threshold, client,
+        symbol_filter=lambda symbol: shard_of(symbol, shards) == shard, weight_share=1 / shards,
+        rules=channel.current_rules,
+        status=lambda: f"алертов {channel.sent}, потеряно {channel.dropped}",
+        name=f"шард {shard}/{shards}", **settings
+    )
+    try:
+        await tracker.run()
+    finally:
+        await channel.stop()
+        await client.close()
+        if metrics_server:
+            await metrics_server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркер-шард трекинга")
+    parser.add_argument("--shard", type=int, required=True)
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--socket", default="alerts.sock", help="Unix-сокет процесса рассылки")
+    parser.add_argument("--settings", default="{}", help="аргументы Tracker, JSON")
+    parser.add_argument("--thresholds", default='{"instant": 3, "price": 0, "oi": 5}',
+                        help="пороги до первой синхронизации, JSON")
+    parser.add_argument("--metrics-port", type=int, help="порт /metrics шарда, без него — выключены")
+    args = parser.parse_args()
+    if not 0 <= args.shard < args.shards:
+        parser.error("--shard должен быть в диапазоне 0..shards-1")
+
+    try:
+        asyncio.run(run_worker(args.shard, args.shards, args.socket,
+                               json.loads(args.settings), json.loads(args.thresholds), args.metrics_port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == "__main__":
+    main()
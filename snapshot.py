@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class SnapshotEngine:
+    """Колоночное состояние цен для пакетной детекции.
+
+    Каждый символ получает постоянную строку; цена и предыдущая цена хранятся
+    в numpy-массивах. Мгновенное изменение и список изменившихся цен считаются
+    для всех символов одним проходом, наружу возвращаются только нужные строки.
+    """
+
+    def __init__(self, capacity: int = 512):
+        self.index = {}                 # symbol -> строка
+        self.symbols = []               # строка -> symbol
+        self.price = np.full(capacity, np.nan)     # цена прошлого тика
+        self.prev = np.full(capacity, np.nan)      # цена позапрошлого тика
+        self._keys = None               # порядок ключей прошлого снапшота
+        self._rows = None               # строки для этого порядка
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def row(self, symbol: str) -> int:
+        return self.index.get(symbol, -1)
+
+    def _grow(self, size: int):
+        capacity = len(self.price)
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2)
+        for name in ("price", "prev"):
+            column = getattr(self, name)
+            grown = np.full(new_capacity, np.nan)
+            grown[:capacity] = column
+            setattr(self, name, grown)
+
+    def _rows_for(self, keys: list) -> np.ndarray:
+        """Строки для символов снапшота; новые символы получают строку"""
+        if keys == self._keys:
+            return self._rows
+        new = [symbol for symbol in keys if symbol not in self.index]
+        if new:
+            self._grow(len(self.symbols) + len(new))
+            for symbol in new:
+                self.index[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+        self._keys = keys
+        self._rows = np.fromiter((self.index[s] for s in keys), dtype=np.intp, count=len(keys))
+        return self._rows
+
+    def load(self, symbols: list, price, prev):
+        """Восстанавливает колонки из чекпоинта; price/prev — в порядке symbols"""
+        rows = self._rows_for(list(symbols))
+        self.price[rows] = price
+        self.prev[rows] = prev
+
+    def update(self, prices: dict, instant_threshold: float) -> dict:
+        """Применяет снапшот цен.
+
+        {"instant": [(symbol, change)], "changed": [(symbol, old_price, new_price)]}
+        """
+        keys = list(prices)
+        rows = self._rows_for(keys)
+        n = len(self.symbols)
+
+        current = np.full(n, np.nan)
+        current[rows] = np.fromiter(prices.values(), dtype=np.float64, count=len(keys))
+
+        price = self.price[:n]
+        prev = self.prev[:n]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Мгновенное изменение — к цене позапрошлого тика
+            instant = (current - prev) / prev * 100
+            instant_hit = np.flatnonzero(np.abs(instant) >= instant_threshold)
+
+        # Изменившиеся цены (включая впервые появившиеся символы)
+        changed = np.flatnonzero((current == current) & (current != price))
+
+        symbols = self.symbols
+        result = {
+            "instant": [(symbols[i], float(instant[i])) for i in instant_hit],
+            "changed": [(symbols[i], float(price[i]), float(current[i])) for i in changed],
+        }
+
+        # Сдвиг тиков: пропавшие из снапшота символы остаются без цены
+        prev[:] = price
+        price[:] = current
+        return result
@@ -0,0 +1,254 @@
+"""Локальная подмена Binance (WS + REST) и самопроверка без сети.
+
+    python standin.py                   # все проверки, код выхода 1 при ошибке
+    python standin.py --serve 8765      # только подмена: WS ws://127.0.0.1:8765/ws
+
+Проверки:
+  • разрыв WS → переподключение → ресинк по REST (merge_snapshot): устаревшая
+    цена стрима заменяется снимком, более свежая цена стрима остаётся;
+  • старт: ровно один REST-снимок, цены стрима во время prime не теряются;
+  • трёхзначная логика правил (RulePlan) при неизвестных метриках;
+  • индекс подписчиков (match / min_threshold);
+  • снимок состояния (checkpoint): запись и тёплый старт.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from aiohttp import web
+
+import feeds
+from alerts import AlertBatcher
+from checkpoint import StateCheckpoint
+from detector import Detector
+from rules import Rule, RulePlan
+from subscriptions import SubscriptionIndex, default_settings
+
+
+class LocalBinance:
+    """aiohttp-сервер с !ticker@arr по WS и /fapi/v1/ticker/24hr по REST.
+
+    `sessions` — кадры на каждое подключение по порядку: [(цены, сдвиг E в сек)];
+    после последнего кадра сессии, кроме последней, сервер рвёт соединение.
+    `rest` — {symbol: (цена, сдвиг closeTime в сек)}, `rest_delay` — задержка ответа.
+    """
+
+    def __init__(self, sessions: list, rest: dict, rest_delay: float = 0, frame_interval: float = 0.1):
+        self.sessions = sessions
+        self.rest = rest
+        self.rest_delay = rest_delay
+        self.frame_interval = frame_interval
+        self.connections = 0
+        self.snapshots = 0
+        self._runner = None
+
+    async def start(self, port: int = 0) -> int:
+        app = web.Application()
+        app.router.add_get("/ws", self._ws)
+        app.router.add_get("/fapi/v1/ticker/24hr", self._ticker)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.receive()                  # SUBSCRIBE
+        index = min(self.connections, len(self.sessions) - 1)
+        self.connections += 1
+        for prices, shift in self.sessions[index]:
+            event_time = int((time.time() + shift) * 1000)
+            data = [{"s": symbol, "c": str(price), "E": event_time} for symbol, price in prices.items()]
+            await ws.send_str(json.dumps({"stream": "!ticker@arr", "data": data}))
+            await asyncio.sleep(self.frame_interval)
+        if index < len(self.sessions) - 1:
+            await ws.close()
+        else:
+            await ws.receive()              # держим соединение до закрытия клиентом
+        return ws
+
+    async def _ticker(self, request):
+        self.snapshots += 1
+        await asyncio.sleep(self.rest_delay)
+        now = time.time()
+        return web.json_response([
+            {"symbol": symbol, "lastPrice": str(price), "closeTime": int((now + shift) * 1000)}
+            for symbol, (price, shift) in self.rest.items()
+        ])
+
+
+async def _with_feed(server: LocalBinance, scenario):
+    port = await server.start()
+    base_url = feeds.BinanceUsdmFeed.base_url
+    feeds.BinanceUsdmFeed.base_url = f"http://127.0.0.1:{port}"
+    state = feeds.MarketState()
+    feed = feeds.BinanceUsdmFeed(state, ws_url=f"ws://127.0.0.1:{port}/ws", poll_interval=0.2)
+    try:
+        return await scenario(state, feed)
+    finally:
+        await feed.stop()
+        await server.stop()
+        feeds.BinanceUsdmFeed.base_url = base_url
+
+
+async def check_reconnect_gap():
+    # 1-е подключение: BTC 110 с событием минутной давности и обрыв;
+    # 2-е: свежая ETH 5. REST: BTC 999 свежее стрима, ETH 4 старее
+    server = LocalBinance(
+        sessions=[[({"BTCUSDT": 110}, -60)], [({"ETHUSDT": 5}, 0)]],
+        rest={"BTCUSDT": (999, 0), "ETHUSDT": (4, -10)},
+    )
+
+    async def scenario(state, feed):
+        feed.stream.gap_threshold = 1
+        feed.start()
+        await asyncio.sleep(2.5)
+        assert server.connections >= 2, f"нет переподключения ({server.connections})"
+        assert state.prices.get("BTCUSDT") == 999, f"BTC не пересинхронизирован: {state.prices}"
+        assert state.prices.get("ETHUSDT") == 5, f"ETH перезаписан старым снимком: {state.prices}"
+
+    await _with_feed(server, scenario)
+
+
+async def check_startup_prime():
+    # REST отвечает после последнего кадра стрима (BTC 100..104) и со старой ценой BTC
+    server = LocalBinance(
+        sessions=[[({"BTCUSDT": 100 + i}, 0) for i in range(5)]],
+        rest={"BTCUSDT": (99, -1), "ETHUSDT": (4, 0)},
+        rest_delay=0.8,
+    )
+
+    async def scenario(state, feed):
+        feed.start()
+        await feed.prime()
+        await asyncio.sleep(1)
+        assert server.snapshots == 1, f"REST-снимков при старте: {server.snapshots}"
+        assert state.prices.get("BTCUSDT") == 104, f"цена стрима потеряна: {state.prices}"
+        assert feed.stream.prices.get("BTCUSDT") == 104, f"снимок перезаписал стрим: {feed.stream.prices}"
+        assert state.prices.get("ETHUSDT") == 4, f"нет цены из снимка: {state.prices}"
+
+    await _with_feed(server, scenario)
+
+
+def check_rules():
+    rules = [Rule(text) for text in ("price 5m >= 3 and oi >= 5", "price 5m >= 3 or oi >= 5",
+                                     "not oi >= 5", "not (price 5m >= 3 and oi >= 5)")]
+    plan = RulePlan(rules)
+    price, oi = plan.metrics.index(("price", 300)), plan.metrics.index(("oi", 0))
+    values = np.full((3, len(plan.metrics)), np.nan)
+    values[0, price] = 4                    # цена выросла, OI неизвестен
+    values[1, price] = 1                    # цена не выросла, OI неизвестен
+    # строка 2: ничего не известно
+    hits = [hit.tolist() for hit in plan.evaluate(values)]
+    assert hits[0] == [False, False, False], hits[0]        # and: неизвестно или ложно
+    assert hits[1] == [True, False, False], hits[1]         # or: хватает известной истины
+    assert hits[2] == [False, False, False], hits[2]        # not неизвестного — неизвестно
+    assert hits[3] == [False, True, False], hits[3]         # not (ложно and ?) — истинно
+    values[0, oi] = 6
+    assert plan.evaluate(values)[0].tolist() == [True, False, False]
+    try:
+        Rule("not " * 50 + "oi >= 5")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("глубокая вложенность не отклонена")
+
+
+def check_subscriptions():
+    index = SubscriptionIndex()
+    index.add(1, default_settings({"instant": 1, "price": 0, "oi": 5}))
+    index.add(2, dict(default_settings({"instant": 3, "price": 0, "oi": 2}), symbols=["BTCUSDT"]))
+    index.add(3, dict(default_settings({"instant": 0.5, "price": 0, "oi": 1}), muted=True))
+    assert sorted(index.match("instant", "BTCUSDT", -3.5)) == [1, 2]
+    assert index.match("instant", "ETHUSDT", 2) == [1]
+    assert index.match("oi", "BTCUSDT", 2) == [2]
+    assert index.min_threshold("instant", 10) == 1
+    index.remove(1)
+    assert index.match("instant", "ETHUSDT", 2) == []
+    assert index.min_threshold("instant", 10) == 3
+
+
+def check_checkpoint():
+    async def noop(*args):
+        pass
+
+    def make():
+        detector = Detector(noop, noop, {60: 5}, {"instant": 100, "price": 0, "oi": 100}.get,
+                            {}, {}, 1, 60, rules=lambda: ["price 5m >= 3"])
+        detector.sync_rules()
+        return detector, AlertBatcher(noop, lambda *args: [], cooldown=60)
+
+    now = time.time()
+    detector, batcher = make()
+    asyncio.run(detector.process_prices({"BTCUSDT": 100.0, "ETHUSDT": 10.0}, now - 2))
+    asyncio.run(detector.process_prices({"BTCUSDT": 104.0, "ETHUSDT": 10.1}, now - 1))
+    detector.last_oi_values["BTCUSDT"] = 5e6
+    batcher.cooldown_until[("price", "BTCUSDT", 42)] = now + 30
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "state.bin")
+        with open(path, "wb") as f:
+            f.write(StateCheckpoint(path, detector, batcher).dump(now))
+        restored, restored_batcher = make()
+        assert StateCheckpoint(path, restored, restored_batcher).restore(now)
+
+    assert restored.engine.symbols == detector.engine.symbols
+    assert restored.windows.move_of("BTCUSDT", 60, now) == detector.windows.move_of("BTCUSDT", 60, now)
+    assert restored.rule_windows.move_of("BTCUSDT", 300, now) > 3
+    assert restored._rule_active == {"price 5m >= 3": {"BTCUSDT"}}, restored._rule_active
+    assert restored.last_oi_values == {"BTCUSDT": 5e6}
+    assert restored_batcher.cooldown_until == {("price", "BTCUSDT", 42): now + 30}
+
+
+CHECKS = [
+    ("WS: разрыв → ресинк по REST", lambda: asyncio.run(check_reconnect_gap())),
+    ("WS: один снимок при старте", lambda: asyncio.run(check_startup_prime())),
+    ("Правила: логика Клини", check_rules),
+    ("Индекс подписчиков", check_subscriptions),
+    ("Снимок состояния", check_checkpoint),
+]
+
+
+async def serve(port: int):
+    server = LocalBinance(
+        sessions=[[({"BTCUSDT": 100 + i % 10, "ETHUSDT": 10 + i % 3}, 0) for i in range(10 ** 6)]],
+        rest={"BTCUSDT": (100, 0), "ETHUSDT": (10, 0)},
+        frame_interval=1,
+    )
+    await server.start(port)
+    print(f"🧪 Подмена Binance: ws://127.0.0.1:{port}/ws, http://127.0.0.1:{port}/fapi/v1/ticker/24hr")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная подмена Binance и самопроверка")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="только поднять подмену на порту")
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve(args.serve))
+        return
+
+    failed = 0
+    for name, check in CHECKS:
+        try:
+            check()
+            print(f"✅ {name}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {name}: {type(e).__name__}: {e}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
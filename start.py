@@ -1,19 +1,11 @@
 import asyncio
 import logging
-from main import dp, bot, CHAT_IDS, track_changes
 
-logging.basicConfig(level=logging.INFO)
+import main
 
-async def main():
-    print("🚀 Запуск start.py...")
-    
-    if CHAT_IDS:
-        print(f"✅ Найдено {len(CHAT_IDS)} пользователей")
-        asyncio.create_task(track_changes())
-    else:
-        print("⚠️ Нет пользователей")
-    
-    await dp.start_polling(bot)
+logging.basicConfig(level=logging.INFO)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # Тот же запуск, что и python main.py, но с логами aiogram
+    print("🚀 Запуск start.py...")
+    asyncio.run(main.main())
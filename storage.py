@@ -0,0 +1,127 @@
+import asyncio
+import json
+import os
+import sqlite3
+
+
+class SubscriberStore:
+    """Подписчики и их настройки в SQLite (WAL).
+
+    Изменения копятся в памяти и пишутся пачкой в фоновом потоке одной
+    транзакцией — event loop не блокируется, а падение посреди записи не
+    портит базу.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._conn = None
+        self._pending = {}          # chat_id -> JSON настроек или None (удаление)
+        self._lock = asyncio.Lock()
+        self._flush_handle = None
+
+    # ── Открытие и миграция ─────────────────────────────────────────────────
+    def open(self):
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS subscribers (
+                chat_id  INTEGER PRIMARY KEY,
+                settings TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key   TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        self._conn.commit()
+
+    def migrate_json(self, chat_ids_file: str, settings_file: str = None):
+        """Однократный перенос chat_ids.json (и файла настроек) в базу"""
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+
+        chat_ids, settings = [], {}
+        try:
+            if os.path.exists(chat_ids_file):
+                with open(chat_ids_file, "r", encoding="utf-8") as f:
+                    chat_ids = [int(chat_id) for chat_id in json.load(f)]
+            if settings_file and os.path.exists(settings_file):
+                with open(settings_file, "r", encoding="utf-8") as f:
+                    settings = {int(k): v for k, v in json.load(f).items()}
+        except Exception as e:
+            print(f"Ошибка миграции {chat_ids_file}: {e}")
+            return
+
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO subscribers (chat_id, settings) VALUES (?, ?)",
+                [(chat_id, json.dumps(settings.get(chat_id, {}), ensure_ascii=False)) for chat_id in chat_ids],
+            )
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+        print(f"[INIT] Перенесено в базу {len(chat_ids)} пользователей из {chat_ids_file}")
+
+    def load(self) -> dict:
+        """chat_id -> сохранённые настройки"""
+        rows = self._conn.execute("SELECT chat_id, settings FROM subscribers").fetchall()
+        return {chat_id: json.loads(settings or "{}") for chat_id, settings in rows}
+
+    # ── Запись ──────────────────────────────────────────────────────────────
+    def put(self, chat_id: int, settings: dict):
+        self._pending[chat_id] = json.dumps(settings, ensure_ascii=False)
+        self._schedule()
+
+    def delete(self, chat_id: int):
+        self._pending[chat_id] = None
+        self._schedule()
+
+    def _schedule(self):
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # до запуска loop — запишется при первом flush/close
+        self._flush_handle = loop.call_later(self.flush_interval, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        self._flush_handle = None
+        if not self._pending:
+            return
+        async with self._lock:
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                print(f"Ошибка записи подписчиков: {e}")
+                # не теряем изменения: более свежие правки важнее старых
+                self._pending = {**batch, **self._pending}
+                self._schedule()
+                return
+        print(f"💾 Сохранено изменений подписчиков: {len(batch)}")
+
+    def _write(self, batch: dict):
+        upserts = [(chat_id, settings) for chat_id, settings in batch.items() if settings is not None]
+        deletes = [(chat_id,) for chat_id, settings in batch.items() if settings is None]
+        with self._conn:
+            if upserts:
+                self._conn.executemany(
+                    "INSERT INTO subscribers (chat_id, settings) VALUES (?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET settings = excluded.settings",
+                    upserts,
+                )
+            if deletes:
+                self._conn.executemany("DELETE FROM subscribers WHERE chat_id = ?", deletes)
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,138 @@
+from bisect import bisect_right, insort
+
+ALERT_KINDS = ("instant", "price", "oi")
+ALL_SYMBOLS = "*"
+RULE_TOPIC = "rule:"        # тип алерта составного правила: "rule:" + каноническая запись
+
+
+def default_settings(thresholds: dict) -> dict:
+    return {
+        "thresholds": dict(thresholds),     # kind -> % (для price — доп. порог поверх окон)
+        "kinds": list(ALERT_KINDS),         # включённые типы алертов
+        "symbols": [],                      # пусто — все монеты
+        "rules": [],                        # составные правила (канонические записи, см. rules.py)
+        "muted": False,
+    }
+
+
+class SubscriptionIndex:
+    """Индекс получателей: (тип алерта, символ) -> отсортированные пороги.
+
+    Получатели одного алерта находятся бинарным поиском по порогу:
+    O(log n + совпадения) вместо перебора всех пользователей.
+    """
+
+    def __init__(self):
+        self.buckets = {}       # (kind, symbol | "*") -> [(threshold, chat_id)]
+        self.entries = {}       # chat_id -> [(kind, symbol, threshold)]
+        self._min = {}          # kind -> минимальный порог (кэш)
+        self._rules = None      # правила всех подписчиков (кэш)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, chat_id: int, settings: dict):
+        self.remove(chat_id)
+        if settings["muted"]:
+            return
+        symbols = settings["symbols"] or [ALL_SYMBOLS]
+        entries = []
+        kinds = [(kind, settings["thresholds"][kind]) for kind in settings["kinds"]]
+        kinds += [(RULE_TOPIC + rule, 0) for rule in settings.get("rules", ())]
+        for kind, threshold in kinds:
+            for symbol in symbols:
+                insort(self.buckets.setdefault((kind, symbol), []), (threshold, chat_id))
+                entries.append((kind, symbol, threshold))
+        self.entries[chat_id] = entries
+        self._min.clear()
+        self._rules = None
+
+    def remove(self, chat_id: int):
+        for kind, symbol, threshold in self.entries.pop(chat_id, ()):
+            bucket = self.buckets[(kind, symbol)]
+            bucket.remove((threshold, chat_id))
+            if not bucket:
+                del self.buckets[(kind, symbol)]
+        self._min.clear()
+        self._rules = None
+
+    def match(self, kind: str, symbol: str, value: float) -> list:
+        """chat_id, чей порог для `kind` по `symbol` не выше |value|"""
+        key = (abs(value), float("inf"))
+        matched = []
+        for bucket_key in ((kind, symbol), (kind, ALL_SYMBOLS)):
+            bucket = self.buckets.get(bucket_key)
+            if bucket:
+                matched.extend(chat_id for _, chat_id in bucket[:bisect_right(bucket, key)])
+        return matched
+
+    def min_threshold(self, kind: str, default: float) -> float:
+        """Наименьший порог среди подписчиков — с него детектор и начинает срабатывать"""
+        if kind not in self._min:
+            thresholds = [bucket[0][0] for (k, _), bucket in self.buckets.items() if k == kind]
+            self._min[kind] = min(thresholds) if thresholds else default
+        return self._min[kind]
+
+    def rules(self) -> tuple:
+        """Правила всех подписчиков без повторов — из них детектор собирает общий план"""
+        if self._rules is None:
+            self._rules = tuple(sorted({kind[len(RULE_TOPIC):] for kind, _ in self.buckets
+                                        if kind.startswith(RULE_TOPIC)}))
+        return self._rules
+
+
+class SubscriptionManager:
+    """Настройки пользователей (пороги, типы алертов, монеты, mute) и их индекс"""
+
+    def __init__(self, store, defaults: dict):
+        self.store = store      # put(chat_id, settings) / delete(chat_id)
+        self.defaults = defaults
+        self.settings = {}      # chat_id -> settings
+        self.index = SubscriptionIndex()
+
+    def load(self, stored: dict):
+        """Поднимает настройки из {chat_id: сохранённые настройки}"""
+        for chat_id, data in stored.items():
+            settings = default_settings(self.defaults)
+            settings.update(data)
+            settings["thresholds"] = {**self.defaults, **data.get("thresholds", {})}
+            self.settings[chat_id] = settings
+            self.index.add(chat_id, settings)
+        print(f"[INIT] Загружены настройки {len(self.settings)} пользователей")
+
+    def register(self, chat_id: int) -> dict:
+        """Настройки по умолчанию для нового подписчика — с этого момента он получает алерты"""
+        settings = self.settings.get(chat_id)
+        if settings is None:
+            settings = self.settings[chat_id] = default_settings(self.defaults)
+            self.index.add(chat_id, settings)
+            self.store.put(chat_id, settings)
+        return settings
+
+    def get(self, chat_id: int) -> dict:
+        """Настройки подписчика; незарегистрированному — умолчания, без записи и индекса"""
+        settings = self.settings.get(chat_id)
+        return settings if settings is not None else default_settings(self.defaults)
+
+    def remove(self, chat_id: int):
+        if self.settings.pop(chat_id, None) is not None:
+            self.index.remove(chat_id)
+        self.store.delete(chat_id)
+
+    def update(self, chat_id: int, **changes) -> dict:
+        settings = self.settings[chat_id]      # только зарегистрированные (register)
+        if "thresholds" in changes:
+            settings["thresholds"].update(changes.pop("thresholds"))
+        settings.update(changes)
+        self.index.add(chat_id, settings)
+        self.store.put(chat_id, settings)
+        return settings
+
+    def match(self, kind: str, symbol: str, value: float) -> list:
+        return self.index.match(kind, symbol, value)
+
+    def min_threshold(self, kind: str) -> float:
+        return self.index.min_threshold(kind, self.defaults[kind])
+
+    def rules(self) -> tuple:
+        return self.index.rules()
@@ -0,0 +1,182 @@
+from string import Formatter
+from typing import NamedTuple
+
+import metrics
+
+RENDERS = metrics.counter("alert_renders_total", "Отрендеренные сообщения алертов")
+
+RULE = "─" * 20
+
+# Макеты сообщений по локалям (синтаксис str.format). Поля — сырые значения
+# события и готовые фрагменты, собранные MessageRenderer.
+TEMPLATES = {
+    "ru": {
+        "price": (
+            "🚨 {emoji} {symbol} {type_icon} {alert_type}\n"
+            f"{RULE}\n"
+            "📊 Цена: {price_change:+.2f}%\n"
+            "{oi}"
+            "{funding}"
+            "⚡ {speed} • {elapsed:.0f}s • ⌚ {window} мин"
+        ),
+        "price_line": "{emoji} {symbol} {type_icon} {price_change:+.2f}% • {elapsed:.0f}s",
+        "oi": (
+            "🚨 {symbol} {oi_emoji} OI РОСТ {oi_change:+.2f}%\n"
+            f"{RULE}\n"
+            "{oi_emoji} OI: {oi_value}\n"
+            "{price}"
+            "{funding}"
+            "⚡ FAST • {interval:.1f}с"
+        ),
+        "oi_line": "{oi_emoji} {symbol} OI {oi_change:+.2f}% ({oi_value})",
+        "oi_part": "{oi_emoji} OI: {oi_change:+.2f}% ({oi_value})\n",
+        "oi_plain": "📊 OI: {oi_value}\n",
+        "price_part": "{price_emoji} Цена: {price_change:+.2f}%\n",
+        "funding": "{funding_emoji} Funding: {rate:.4f}%{next}\n",
+        "funding_next": " (через {hours}ч {minutes}м)",
+        "digest": f"🚨 Движение рынка: {{count}} алертов\n{RULE}\n{{lines}}",
+        "digest_more": "…и ещё {count}",
+        "fast": "⚡ FAST",
+        "normal": "🏃 NORMAL",
+        "slow": "🐢 SLOW",
+        "rule": (
+            "🚨 {symbol} 🧩 ПРАВИЛО\n"
+            f"{RULE}\n"
+            "📋 {rule}\n"
+            "{values}"
+        ),
+        "rule_line": "🧩 {symbol} • {rule}",
+        "rule_value": "{icon} {name}: {value}",
+    },
+}
+
+
+def format_number(num: float) -> str:
+    """Форматирование больших чисел"""
+    if num > 1_000_000_000:
+        return f"{num / 1_000_000_000:.2f}B"
+    elif num > 1_000_000:
+        return f"{num / 1_000_000:.2f}M"
+    elif num > 1_000:
+        return f"{num / 1_000:.2f}K"
+    else:
+        return f"{num:.0f}"
+
+
+class Template:
+    """Макет, разобранный один раз: поля известны заранее, рендер — один format_map"""
+
+    def __init__(self, layout: str):
+        self.layout = layout
+        self.fields = {field for _, field, _, _ in Formatter().parse(layout) if field}
+        self.render = layout.format_map
+
+
+class Rendered(NamedTuple):
+    """Готовое сообщение алерта: полный текст и строка для дайджеста"""
+    text: str
+    line: str
+
+
+class MessageRenderer:
+    """Рендер событий алертов в сообщения по шаблонам локали.
+
+    Событие — (имя шаблона, словарь полей): детектор и воркеры шлют только
+    данные, текст собирается один раз на событие и локаль, а рассылка N чатам
+    отправляет уже готовую строку. Шаблоны компилируются при первом обращении
+    к локали; неизвестная локаль или шаблон берутся из `default_locale`.
+    """
+
+    def __init__(self, templates: dict = None, default_locale: str = "ru"):
+        self.templates = templates or TEMPLATES
+        self.default_locale = default_locale
+        self._compiled = {}         # locale -> {имя шаблона -> Template}
+
+    def compiled(self, locale: str = None) -> dict:
+        locale = locale if locale in self.templates else self.default_locale
+        compiled = self._compiled.get(locale)
+        if compiled is None:
+            layouts = {**self.templates[self.default_locale], **self.templates[locale]}
+            compiled = self._compiled[locale] = {name: Template(layout) for name, layout in layouts.items()}
+        return compiled
+
+    def render(self, event, locale: str = None) -> Rendered:
+        name, fields = event
+        RENDERS.inc()
+        if name == "price":
+            return self._price(self.compiled(locale), fields)
+        if name == "oi":
+            return self._oi(self.compiled(locale), fields)
+        if name == "rule":
+            return self._rule(self.compiled(locale), fields)
+        raise ValueError(f"неизвестный шаблон алерта: {name}")
+
+    def digest(self, lines: list, total: int, locale: str = None) -> str:
+        t = self.compiled(locale)
+        if total > len(lines):
+            lines = lines + [t["digest_more"].render({"count": total - len(lines)})]
+        return t["digest"].render({"count": total, "lines": "\n".join(lines)})
+
+    # ── Шаблоны алертов ─────────────────────────────────────────────────────
+    def _funding(self, t: dict, fields: dict) -> str:
+        rate = fields.get("funding_rate")
+        if not rate:
+            return ""
+        left = (fields.get("funding_next") or 0) / 1000 - fields["now"]
+        next_str = ""
+        if left > 0:
+            next_str = t["funding_next"].render({"hours": int(left // 3600), "minutes": int(left % 3600 // 60)})
+        return t["funding"].render({"funding_emoji": "📈" if rate > 0 else "📉", "rate": rate, "next": next_str})
+
+    def _price(self, t: dict, fields: dict) -> Rendered:
+        price_change = fields["price_change"]
+        elapsed = fields["elapsed"]
+        oi, oi_change = fields.get("oi"), fields.get("oi_change")
+        oi_str = ""
+        if oi and oi > 0:
+            if oi_change is not None and abs(oi_change) >= 0.01:
+                oi_str = t["oi_part"].render({"oi_emoji": "📈" if oi_change > 0 else "📉",
+                                              "oi_change": oi_change, "oi_value": format_number(oi)})
+            else:
+                oi_str = t["oi_plain"].render({"oi_value": format_number(oi)})
+
+        values = {
+            **fields,
+            "emoji": "🟢" if price_change > 0 else "🔴",
+            "type_icon": "⚡" if fields["instant"] else "📈",
+            "speed": t["fast" if elapsed < 20 else "normal" if elapsed < 60 else "slow"].render(fields),
+            "oi": oi_str,
+            "funding": self._funding(t, fields),
+        }
+        return Rendered(t["price"].render(values), t["price_line"].render(values))
+
+    def _oi(self, t: dict, fields: dict) -> Rendered:
+        oi_change = fields["oi_change"]
+        price_change = fields.get("price_change")
+        price_str = ""
+        if price_change and abs(price_change) >= 0.01:
+            price_str = t["price_part"].render({"price_emoji": "🟢" if price_change > 0 else "🔴",
+                                                "price_change": price_change})
+        values = {
+            **fields,
+            "oi_emoji": "📈" if oi_change > 0 else "📉",
+            "oi_value": format_number(fields["oi"]),
+            "price": price_str,
+            "funding": self._funding(t, fields),
+        }
+        return Rendered(t["oi"].render(values), t["oi_line"].render(values))
+
+    def _rule(self, t: dict, fields: dict) -> Rendered:
+        lines = []
+        for name, value in fields["values"]:
+            kind = name.split()[0]
+            if value != value:          # NaN — метрики нет
+                text = "—"
+            elif kind == "funding":
+                text = f"{value:.4f}%"
+            else:
+                text = f"{value:+.2f}%"
+            icon = {"price": "📊", "oi": "📈", "funding": "💰"}.get(kind, "•")
+            lines.append(t["rule_value"].render({"icon": icon, "name": name, "value": text}))
+        values = {**fields, "values": "\n".join(lines)}
+        return Rendered(t["rule"].render(values), t["rule_line"].render(values))
@@ -0,0 +1,176 @@
+import asyncio
+import time
+import traceback
+
+import metrics
+from binance_client import BinanceClient
+from checkpoint import StateCheckpoint
+from detector import Detector
+from feeds import MarketState, BinanceUsdmFeed, FEEDS
+from fetcher import MarketDataFetcher
+from history import HistoryWriter
+from replay import MarketRecorder
+
+CYCLE_SECONDS = metrics.histogram("tracker_cycle_seconds", "Длительность цикла трекинга (без ожидания цен)")
+DETECT_SECONDS = metrics.histogram("tracker_detect_seconds", "Время детекции по снапшоту цен")
+
+
+class Tracker:
+    """Цикл трекинга: рынки → детектор → алерты.
+
+    Один на процесс бота или по одному на воркер-шард (см. sharding.py).
+    publisher — AlertPublisher, batcher — куда он складывает алерты
+    (AlertBatcher или канал к процессу рассылки); flush вызывается раз в цикл.
+    symbol_filter оставляет монеты своего шарда, weight_share — его доля
+    лимита веса Binance. rules — callable() -> составные правила подписчиков.
+    """
+
+    def __init__(self, publisher, batcher, thresholds, client: BinanceClient, markets=("binance_usdm",),
+                 use_websocket: bool = True, ws_url: str = None, check_interval: float = 0.5,
+                 windows: dict = None, timeframe: int = 15, fetch_concurrency: int = 10,
+                 oi_interval: float = 10, oi_min_interval: float = 2, oi_max_interval: float = 60,
+                 funding_interval: float = 60, http_timeout: float = 5,
+                 record_file: str = None, state_file: str = None, state_interval: float = 30, history: dict = None,
+                 symbol_filter=None, weight_share: float = 1.0, rules=None, status=None, on_stage=None,
+                 name: str = ""):
+        self.publisher = publisher
+        self.batcher = batcher
+        self.client = client
+        self.check_interval = check_interval
+        self.funding_interval = funding_interval
+        self.status = status            # callable -> доп. строка отчёта
+        self.on_stage = on_stage        # callable(этап) — замер запуска: primed, prices
+        self.name = name
+
+        # Цены рынков — каждый адаптер в своей задаче (WebSocket + REST-сверка
+        # после разрывов или опрос REST), всё сходится в общую карту цен
+        self.market = MarketState()
+        self.usdm = BinanceUsdmFeed(self.market, client=client, use_stream=use_websocket,
+                                    poll_interval=check_interval, ws_url=ws_url, symbol_filter=symbol_filter)
+        self.feeds = [self.usdm] + [
+            FEEDS[market](self.market, use_stream=use_websocket, poll_interval=check_interval,
+                          timeout=http_timeout, symbol_filter=symbol_filter, weight_share=weight_share)
+            for market in markets if market != self.usdm.name
+        ]
+
+        # OI и Funding подгружаются в фоне и пишутся в общие словари;
+        # OI активных монет опрашивается чаще (см. _activity)
+        self.fetcher = MarketDataFetcher(
+            self.usdm.open_interest, self.usdm.funding_rates,
+            concurrency=fetch_concurrency, oi_interval=oi_interval, funding_interval=funding_interval,
+            oi_min_interval=oi_min_interval, oi_max_interval=oi_max_interval, activity=self._activity
+        )
+        self.detector = Detector(
+            publisher.price_alert, publisher.oi_alert,
+            {int(m) * 60: t for m, t in (windows or {timeframe: 10}).items()}, thresholds,
+            self.fetcher.oi_values, self.fetcher.funding_rates, check_interval, timeframe * 60,
+            rules=rules, on_rule_alert=publisher.rule_alert
+        )
+        # Запись рынка для офлайн-replay
+        self.recorder = MarketRecorder(record_file) if record_file else None
+        # Снимки состояния детекции для тёплого рестарта
+        self.checkpoint = StateCheckpoint(state_file, self.detector, batcher, state_interval) if state_file else None
+        # История цен / OI / Funding для /chart и /top (аргументы HistoryWriter)
+        self.history = HistoryWriter(**history) if history else None
+
+    def _activity(self, symbol: str) -> tuple:
+        """Движение цены в самом коротком окне (%) и объём за 24ч — приоритет опроса OI"""
+        windows = self.detector.windows
+        return windows.move_of(symbol, windows.windows[0][0], time.time()), self.usdm.volumes.get(symbol, 0.0)
+
+    async def prime(self):
+        """Базовые цены и Funding одним bulk-запросом каждого — параллельно с подключением потока"""
+        prices, funding = await asyncio.gather(self.usdm.prime(), self.usdm.funding_rates(),
+                                               return_exceptions=True)
+        if isinstance(funding, dict):
+            self.fetcher.funding_rates.update(funding)
+        else:
+            print(f"⚠️ Funding при старте не загружен: {funding}")
+        if self.on_stage and isinstance(prices, dict) and prices:
+            self.on_stage("primed")
+
+    async def run(self):
+        print(f"✅ Трекинг цен, OI и Funding запущен{f' ({self.name})' if self.name else ''}")
+        fetcher, detector, recorder, usdm = self.fetcher, self.detector, self.recorder, self.usdm
+        oi_values = fetcher.oi_values
+        funding_rates = fetcher.funding_rates
+
+        if self.checkpoint:
+            detector.sync_rules()       # окна правил — до загрузки снимка
+            self.checkpoint.restore()
+            self.checkpoint.start()
+        fetcher.start()
+        if usdm.stream:
+            usdm.stream.mark = funding_rates    # !markPrice@arr сам обновляет funding
+            fetcher.funding_live = lambda: usdm.connected
+        for feed in self.feeds:
+            feed.start()
+        prime = asyncio.create_task(self.prime())
+        if self.history:
+            self.history.start(lambda: (self.market.prices, oi_values, funding_rates))
+
+        last_funding_record = 0.0
+        last_report = time.time()
+        request_count = 0
+        first_cycle = True
+
+        try:
+            while True:
+                try:
+                    # Получаем цены
+                    new_prices = await self.market.wait_prices(timeout=self.check_interval * 10)
+                    current_time = time.time()
+
+                    if not new_prices:
+                        continue
+                    # OI грузится только для основного рынка
+                    fetcher.set_symbols(usdm.prices)
+                    cycle_started = time.perf_counter()
+
+                    # Цены и OI → детектор
+                    with DETECT_SECONDS.time():
+                        await detector.process_prices(new_prices, current_time)
+                        fresh_oi = fetcher.pop_oi_updates()
+                        await detector.process_oi(fresh_oi, current_time)
+
+                    if recorder:
+                        recorder.record_prices(current_time, new_prices)
+                        recorder.record_oi(current_time, {symbol: oi_values[symbol] for symbol in fresh_oi})
+                        if current_time - last_funding_record >= self.funding_interval:
+                            recorder.record_funding(current_time, funding_rates)
+                            last_funding_record = current_time
+
+                    # Алерты цикла уходят одной пачкой
+                    await self.batcher.flush(current_time)
+                    CYCLE_SECONDS.observe(time.perf_counter() - cycle_started)
+                    if first_cycle and self.on_stage:
+                        self.on_stage("prices")
+                    first_cycle = False
+
+                    # Отчет
+                    if current_time - last_report >= 30:
+                        requests = sum(feed.requests for feed in self.feeds)
+                        extra = f"{self.status()}; " if self.status else ""
+                        print(f"[{time.strftime('%H:%M:%S')}]{f' {self.name}:' if self.name else ''} "
+                              f"Запросов: {requests - request_count}, монет: {len(detector)}, {extra}"
+                              + "; ".join(feed.status() for feed in self.feeds))
+                        last_report = current_time
+                        request_count = requests
+
+                except Exception as e:
+                    print(f"❌ Ошибка: {e}")
+                    traceback.print_exc()
+        finally:
+            prime.cancel()
+            await self.stop()
+
+    async def stop(self):
+        await self.fetcher.stop()
+        for feed in self.feeds:
+            await feed.stop()
+        if self.checkpoint:
+            await self.checkpoint.stop()
+        if self.history:
+            await self.history.stop()
+        if self.recorder:
+            self.recorder.close()
@@ -0,0 +1,139 @@
+from bisect import bisect_left
+from collections import deque
+
+
+class SlidingWindow:
+    """Минимум и максимум цены за последние `length` секунд.
+
+    Две монотонные деки: push и вытеснение устаревших точек — O(1) амортизированно.
+    Размер дек ограничен числом тиков в окне.
+    """
+
+    __slots__ = ("length", "mins", "maxs")
+
+    def __init__(self, length: float, maxlen: int = None):
+        self.length = length
+        self.mins = deque(maxlen=maxlen)    # (ts, price), цены возрастают
+        self.maxs = deque(maxlen=maxlen)    # (ts, price), цены убывают
+
+    def push(self, ts: float, price: float):
+        mins, maxs = self.mins, self.maxs
+        while mins and mins[-1][1] >= price:
+            mins.pop()
+        mins.append((ts, price))
+        while maxs and maxs[-1][1] <= price:
+            maxs.pop()
+        maxs.append((ts, price))
+
+        cutoff = ts - self.length
+        while mins[0][0] < cutoff:
+            mins.popleft()
+        while maxs[0][0] < cutoff:
+            maxs.popleft()
+
+    def move(self, price: float):
+        """Наибольшее движение к `price` внутри окна: (%, время экстремума)"""
+        if not self.mins:
+            return 0.0, 0.0
+        low_ts, low = self.mins[0]
+        high_ts, high = self.maxs[0]
+        rise = (price - low) / low * 100
+        drop = (price - high) / high * 100
+        if rise >= -drop:
+            return rise, low_ts
+        return drop, high_ts
+
+    def expire(self, now: float):
+        """Вытесняет точки старше окна; последняя точка — текущая цена — остаётся всегда"""
+        cutoff = now - self.length
+        mins, maxs = self.mins, self.maxs
+        while len(mins) > 1 and mins[0][0] < cutoff:
+            mins.popleft()
+        while len(maxs) > 1 and maxs[0][0] < cutoff:
+            maxs.popleft()
+
+    def reset(self, ts: float, price: float):
+        self.mins.clear()
+        self.maxs.clear()
+        self.push(ts, price)
+
+
+class WindowEngine:
+    """Реальное изменение цены сразу в нескольких скользящих окнах.
+
+    `windows` — {секунды окна: порог в %}. Обновлять нужно только символы, у
+    которых цена изменилась: устаревание экстремумов движение только уменьшает.
+    Окно со сработавшим порогом сбрасывается; окна без порога (для правил)
+    не сбрасываются никогда.
+    """
+
+    def __init__(self, windows: dict, resolution: float = 0.25):
+        self.windows = sorted(windows.items())
+        self.resolution = resolution        # минимальный шаг тиков — для лимита памяти
+        self.state = {}                     # symbol -> [SlidingWindow, ...]
+
+    def _windows_for(self, symbol: str) -> list:
+        windows = self.state.get(symbol)
+        if windows is None:
+            windows = [SlidingWindow(length, int(length / self.resolution) + 2) for length, _ in self.windows]
+            self.state[symbol] = windows
+        return windows
+
+    def add_window(self, length: float, threshold: float = float("inf")):
+        """Дополнительное окно (для правил); без порога — только считает движение"""
+        lengths = [window_length for window_length, _ in self.windows]
+        if length in lengths:
+            return
+        i = bisect_left(lengths, length)
+        self.windows.insert(i, (length, threshold))
+        for windows in self.state.values():
+            windows.insert(i, SlidingWindow(length, int(length / self.resolution) + 2))
+
+    def remove_window(self, length: float):
+        lengths = [window_length for window_length, _ in self.windows]
+        if length not in lengths:
+            return
+        i = lengths.index(length)
+        del self.windows[i]
+        for windows in self.state.values():
+            del windows[i]
+
+    def update(self, changes, ts: float) -> list:
+        """Применяет изменения цен [(symbol, old_price, new_price)] и возвращает
+        сработавшие окна [(symbol, длина окна, %, время экстремума)]"""
+        triggered = []
+        for symbol, old_price, price in changes:
+            windows = self._windows_for(symbol)
+            for (length, threshold), window in zip(self.windows, windows):
+                if old_price == old_price:  # не NaN: старая цена держалась до этого момента
+                    window.push(ts, old_price)
+                window.push(ts, price)
+                change, start_ts = window.move(price)
+                if abs(change) >= threshold:
+                    triggered.append((symbol, length, change, start_ts))
+                    window.reset(ts, price)
+        return triggered
+
+    def load(self, symbol: str, length: float, mins: list, maxs: list, now: float):
+        """Восстанавливает деки окна `length` из чекпоинта, без точек старше окна"""
+        cutoff = now - length
+        for (window_length, _), window in zip(self.windows, self._windows_for(symbol)):
+            if window_length == length:
+                window.mins.extend(point for point in mins if point[0] >= cutoff)
+                window.maxs.extend(point for point in maxs if point[0] >= cutoff)
+                # окно опустело — деки должны быть пустыми вместе
+                if not window.mins or not window.maxs:
+                    window.mins.clear()
+                    window.maxs.clear()
+
+    def move_of(self, symbol: str, length: float, now: float, default: float = 0.0) -> float:
+        """Движение символа в окне `length` на момент `now` (`default`, если окна или данных в нём нет).
+
+        Окна обновляются только при смене цены — точки старше окна здесь
+        вытесняются, иначе у затихшей монеты висело бы старое движение.
+        """
+        for (window_length, _), window in zip(self.windows, self.state.get(symbol, ())):
+            if window_length == length and window.mins:
+                window.expire(now)
+                return window.move(window.mins[-1][1])[0]
+        return default
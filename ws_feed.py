@@ -0,0 +1,211 @@
+import asyncio
+import json
+import time
+
+import aiohttp
+
+import metrics
+
+FUTURES_WS_URL = "wss://fstream.binance.com/stream"
+DEFAULT_STREAMS = ("!ticker@arr", "!markPrice@arr")
+
+WS_RECONNECTS = metrics.counter("ws_reconnects_total", "Переподключения WebSocket")
+WS_GAPS = metrics.counter("ws_gaps_total", "Разрывы в данных WebSocket")
+
+
+class BinanceStream:
+    """Потоковые данные Binance Futures через combined WebSocket.
+
+    Держит актуальную карту цен (из !ticker@arr / !miniTicker@arr) и mark/funding (из !markPrice@arr),
+    сам переподключается, заново подписывается и отмечает разрывы в данных.
+    URL задаётся снаружи, поэтому поток можно гонять против локального WS-стенда.
+    """
+
+    def __init__(self, url: str = FUTURES_WS_URL, streams=DEFAULT_STREAMS, symbol_filter=None,
+                 stale_timeout: float = 10, gap_threshold: float = 5, max_backoff: float = 30,
+                 session: aiohttp.ClientSession = None):
+        self.url = url
+        self.session = session  # общая сессия HTTP-клиента; без неё — своя на соединение
+        self.streams = list(streams)
+        self.symbol_filter = symbol_filter
+        self.stale_timeout = stale_timeout      # сек без сообщений → переподключение
+        self.gap_threshold = gap_threshold      # сек между событиями одного стрима → разрыв
+        self.max_backoff = max_backoff
+
+        self.prices = {}        # symbol -> последняя цена
+        self.volumes = {}       # symbol -> объём за 24ч в котируемой валюте
+        self.event_time = {}    # symbol -> время события последней цены (мс, время Binance)
+        self.changed = {}       # symbol -> цена, пришедшие с прошлого wait_prices
+        self.mark = {}          # symbol -> {"rate", "time", "next_time", "mark_price"}
+        self.last_event = {}    # stream -> время последнего события (мс)
+        self.connected = False
+        self.reconnects = 0
+        self.gaps = 0
+
+        self._gap = True        # до первого снапшота данных нет — считаем это разрывом
+        self._resumed = False   # переподключились — разрыв отмечается с первым кадром
+        self._updated = asyncio.Event()
+        self._task = None
+        self._request_id = 0
+
+    # ── Управление ──────────────────────────────────────────────────────────
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.connected = False
+
+    # ── Потребитель ─────────────────────────────────────────────────────────
+    async def wait_prices(self, timeout: float = 5) -> dict:
+        """Ждёт следующего обновления и возвращает цены, пришедшие с прошлого вызова"""
+        try:
+            await asyncio.wait_for(self._updated.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._updated.clear()
+        changed, self.changed = self.changed, {}
+        return changed
+
+    def consume_gap(self) -> bool:
+        """True, если с прошлого вызова был разрыв и состояние надо сверить по REST"""
+        gap, self._gap = self._gap, False
+        return gap
+
+    def clear_initial_gap(self):
+        """Стартовый разрыв закрыт REST-снимком (FeedAdapter.prime) — если переподключений
+        ещё не было, второй снимок на первом кадре не нужен"""
+        if not self.reconnects:
+            self._gap = False
+
+    def merge_snapshot(self, prices: dict, times: dict = None, taken: float = 0) -> dict:
+        """Цены из REST-снапшота поверх потока, кроме тех, что поток обновил позже снапшота.
+
+        times — время цены снапшота по символу (closeTime, мс), taken — время
+        запроса (мс) для символов без своего времени. Возвращает применённые цены.
+        """
+        event_time = self.event_time
+        applied = {}
+        for symbol, price in prices.items():
+            if event_time.get(symbol, 0) <= (times.get(symbol, taken) if times else taken):
+                applied[symbol] = price
+        self.prices.update(applied)
+        return applied
+
+    # ── Соединение ──────────────────────────────────────────────────────────
+    async def run(self):
+        backoff = 1
+        while True:
+            try:
+                if self.session is not None and not self.session.closed:
+                    await self._connect(self.session)
+                else:
+                    async with aiohttp.ClientSession() as session:
+                        await self._connect(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ WebSocket ошибка: {e}")
+
+            if self.connected:
+                backoff = 1  # соединение было живым — начинаем паузы заново
+            self.connected = False
+            self.reconnects += 1
+            WS_RECONNECTS.inc()
+            self._resumed = True
+            print(f"🔄 WebSocket переподключение через {backoff}с")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _connect(self, session: aiohttp.ClientSession):
+        async with session.ws_connect(self.url, heartbeat=30, autoping=True) as ws:
+            await self._subscribe(ws)
+            self.connected = True
+            print(f"🔌 WebSocket подключен: {', '.join(self.streams)}")
+            await self._read(ws)
+
+    async def _subscribe(self, ws):
+        self._request_id += 1
+        await ws.send_json({"method": "SUBSCRIBE", "params": self.streams, "id": self._request_id})
+
+    async def _read(self, ws):
+        while True:
+            try:
+                msg = await ws.receive(timeout=self.stale_timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ WebSocket: нет данных {self.stale_timeout}с")
+                return
+
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                self._handle(json.loads(msg.data))
+            elif msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED,
+                              aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.ERROR):
+                return
+
+    def _handle(self, payload: dict):
+        stream = payload.get("stream")
+        data = payload.get("data")
+        if stream is None or not isinstance(data, list):
+            return  # ответ на SUBSCRIBE и прочие служебные сообщения
+        if self._resumed:
+            # Первый кадр после переподключения: сверка по REST покроет весь простой
+            self._resumed = False
+            self._mark_gap("переподключение")
+
+        event_time = max((item.get("E", 0) for item in data), default=0)
+        previous = self.last_event.get(stream)
+        if previous and event_time - previous > self.gap_threshold * 1000:
+            self._mark_gap(f"{stream} молчал {(event_time - previous) / 1000:.1f}с")
+        if event_time:
+            self.last_event[stream] = event_time
+
+        if stream.startswith(("!ticker", "!miniTicker")):
+            self._handle_ticker(data)
+        elif stream.startswith("!markPrice"):
+            self._handle_mark(data)
+
+    def _handle_ticker(self, data: list):
+        for item in data:
+            symbol = item.get("s")
+            if not symbol or (self.symbol_filter and not self.symbol_filter(symbol)):
+                continue
+            try:
+                price = float(item["c"])
+            except (KeyError, ValueError, TypeError):
+                continue
+            if price > 0:
+                self.prices[symbol] = price
+                self.volumes[symbol] = float(item.get("q") or 0)
+                self.event_time[symbol] = item.get("E") or 0
+                self.changed[symbol] = price
+        self._updated.set()
+
+    def _handle_mark(self, data: list):
+        for item in data:
+            symbol = item.get("s")
+            if not symbol or (self.symbol_filter and not self.symbol_filter(symbol)):
+                continue
+            try:
+                self.mark[symbol] = {
+                    "rate": float(item.get("r") or 0) * 100,
+                    "time": int(item.get("E") or 0),
+                    "next_time": int(item.get("T") or 0),
+                    "mark_price": float(item["p"]),
+                }
+            except (KeyError, ValueError, TypeError):
+                continue
+
+    def _mark_gap(self, reason: str):
+        if not self._gap:
+            self.gaps += 1
+            WS_GAPS.inc()
+            print(f"⚠️ Разрыв потока: {reason} ({time.strftime('%H:%M:%S')})")
+        self._gap = True